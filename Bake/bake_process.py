@@ -116,7 +116,8 @@ PREFIX = "Q4"
 RESOLUTION = 1024
 COLOR = (0.0, 0.0, 0.0, 1.0)  # Black with full alpha
 OUT_PATH = r"E:\Projects\GIS\GIS-WSL\gis-expiremental\data\Bake"
-BAKE_TYPES = {"DIFFUSE": "Diffuse", "NORMAL": "Normal", "ROUGHNESS": "Roughness"}
+# Normal maps come from the height tiles instead (HeightMap/heightmap_normals.py writes the same Q*_Normal_<UDIM>.jpg)
+BAKE_TYPES = {"DIFFUSE": "Diffuse", "ROUGHNESS": "Roughness"}
 
 # GLOBAL VARIABLES
 nodes_list = []
@@ -0,0 +1,250 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from multiprocessing import get_context
+
+import numpy as np
+from PIL import Image
+
+# Benchmark for the raster stages of the ESA / heightmap pipeline.
+# Runs headless: synthetic inputs, no network, no Blender. ESA/ and HeightMap/ have to be
+# on PYTHONPATH (see README.md):
+#
+#   python Benchmark/raster-benchmark.py --sizes 1024 4096 16384 32768 --output report.json
+#   python Benchmark/raster-benchmark.py --output new.json --compare report.json
+
+import esa_tiles
+from esa_mask import COLOR_CODING, create_masks, stream_masks
+from esa_raster import PngStripWriter
+from esa_stitch import save_raster, stitch_tiles_to_raster
+from esa_tile_cache import TileCache
+from esa_tiles import TILE_SIZE, get_pixel_window, lat_lon_to_pixel, tiles_in_window
+from heightmap_grid import interpolate_height_grid, normalize_height_grid, save_height_map
+
+DEFAULT_SIZES = [1024, 2048, 4096, 8192]
+STAGES = ["create_mask", "stream_masks", "stitch_tiles", "save_raster", "generate_height_map"]
+
+# Synthetic data settings
+SYNTHETIC_SOURCE = "synthetic"
+ZOOM = 17
+ORIGIN_LAT, ORIGIN_LON = 34.21606, 77.45396  # North-west corner of the synthetic bbox
+CLASS_BLOCK = 32  # Size of the land-cover patches in the synthetic overlay (pixels)
+NOISE = 30  # Max per-channel noise added to the class colors (stays inside RGB_TOLERANCE)
+TERRAIN_EXTENT = 8000.0  # Terrain spans -8000..8000 like the Blosm terrains
+TERRAIN_SPACING = 8  # Output pixels per terrain vertex
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where it can't be measured."""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    except (ImportError, AttributeError):
+        return None
+
+
+def pixel_to_lat_lon(px, py, zoom):
+    """Inverse of esa_tiles.lat_lon_to_pixel."""
+    n = 2.0 ** zoom * TILE_SIZE
+    lon = px / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * py / n))))
+    return lat, lon
+
+
+def synthetic_bbox(size):
+    """A (min_lat, max_lat, min_lon, max_lon) bbox whose pixel window at ZOOM is size x size."""
+    left, top = (math.floor(p) for p in lat_lon_to_pixel(ORIGIN_LAT, ORIGIN_LON, ZOOM))
+    # Nudge inwards by a fraction of a pixel so the window doesn't round out by one
+    min_lat, max_lon = pixel_to_lat_lon(left + size - 0.25, top + size - 0.25, ZOOM)
+    max_lat, min_lon = pixel_to_lat_lon(left + 0.25, top + 0.25, ZOOM)
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def synthetic_overlay_rows(top, rows, width, seed=0):
+    """Rows of an ESA-palette overlay: square patches of class colors with a little noise."""
+    palette = np.array(list(COLOR_CODING.values()), dtype=np.int16)
+
+    y = np.arange(top, top + rows)[:, None] // CLASS_BLOCK
+    x = np.arange(width)[None, :] // CLASS_BLOCK
+    classes = (x * 7919 + y * 104729 + seed) % len(palette)
+
+    rng = np.random.default_rng(seed + top)
+    noise = rng.integers(-NOISE, NOISE + 1, size=(rows, width, 3), dtype=np.int16)
+    return np.clip(palette[classes] + noise, 0, 255).astype(np.uint8)
+
+
+def make_overlay(path, size):
+    with PngStripWriter(path, size, size, "RGB") as writer:
+        for top in range(0, size, 256):
+            writer.write(synthetic_overlay_rows(top, min(256, size - top), size))
+
+
+def make_tiles(cache_dir, size):
+    """Fill a TileCache with synthetic tiles covering the synthetic bbox of the given size."""
+    cache = TileCache(cache_dir)
+    window = get_pixel_window(*synthetic_bbox(size), ZOOM)
+    for x, y, _, _ in tiles_in_window(window):
+        if cache.get(SYNTHETIC_SOURCE, ZOOM, x, y):
+            continue
+        pixels = synthetic_overlay_rows(y * TILE_SIZE, TILE_SIZE, TILE_SIZE, seed=x)
+        data = BytesIO()
+        Image.fromarray(pixels).save(data, "PNG")
+        cache.put(SYNTHETIC_SOURCE, ZOOM, x, y, data.getvalue())
+    cache.close()
+
+
+def make_terrain(path, size):
+    """A regular grid of terrain vertices with rolling hills, saved as an (N, 3) float32 .npy."""
+    n = size // TERRAIN_SPACING + 1
+    coords = np.linspace(-TERRAIN_EXTENT, TERRAIN_EXTENT, n, dtype=np.float32)
+    x, y = np.meshgrid(coords, coords)
+    z = 3500 + 600 * np.sin(x / 1500) * np.cos(y / 2100) + 150 * np.sin((x + y) / 400)
+    np.save(path, np.stack([x.ravel(), y.ravel(), z.ravel().astype(np.float32)], axis=1))
+
+
+def prepare_inputs(workdir, size, stages):
+    """Generate the synthetic inputs for one size (outside of the timed runs)."""
+    inputs = {
+        "overlay": os.path.join(workdir, f"overlay_{size}.png"),
+        "tiles": os.path.join(workdir, "tiles"),
+        "raster": os.path.join(workdir, f"stitched_{size}.npy"),
+        "terrain": os.path.join(workdir, f"terrain_{size}.npy"),
+    }
+
+    if {"create_mask", "stream_masks"} & set(stages) and not os.path.isfile(inputs["overlay"]):
+        print(f"Generating {size} x {size} overlay")
+        make_overlay(inputs["overlay"], size)
+
+    if {"stitch_tiles", "save_raster"} & set(stages):
+        print(f"Generating tiles for {size} x {size}")
+        make_tiles(inputs["tiles"], size)
+
+    if "save_raster" in stages and not os.path.isfile(inputs["raster"]):
+        cache = TileCache(inputs["tiles"])
+        stitch_tiles_to_raster(cache, SYNTHETIC_SOURCE, *synthetic_bbox(size), ZOOM, inputs["raster"])
+        cache.close()
+
+    if "generate_height_map" in stages and not os.path.isfile(inputs["terrain"]):
+        print(f"Generating terrain for {size} x {size}")
+        make_terrain(inputs["terrain"], size)
+
+    return inputs
+
+
+def run_stage(stage, size, inputs, workdir):
+    """Run one stage in the current process and return its timing. Meant to run in a fresh process."""
+    output_dir = os.path.join(workdir, f"out_{stage}_{size}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+
+    if stage == "create_mask":
+        create_masks(inputs["overlay"], output_dir)
+    elif stage == "stream_masks":
+        stream_masks(inputs["overlay"], output_dir)
+    elif stage == "stitch_tiles":
+        cache = TileCache(inputs["tiles"])
+        stitch_tiles_to_raster(cache, SYNTHETIC_SOURCE, *synthetic_bbox(size), ZOOM, os.path.join(output_dir, "stitched.npy"))
+        cache.close()
+    elif stage == "save_raster":
+        # The raster is already cropped to the bbox when stitched, this is the PNG encode of it
+        save_raster(inputs["raster"], os.path.join(output_dir, "stitched_cropped.png"))
+    elif stage == "generate_height_map":
+        vertices = np.load(inputs["terrain"])
+        grid_z = interpolate_height_grid(vertices, size, size)
+        save_height_map(normalize_height_grid(grid_z), os.path.join(output_dir, "height_map.png"))
+
+    seconds = time.perf_counter() - start
+    return {
+        "stage": stage,
+        "size": size,
+        "seconds": round(seconds, 4),
+        "megapixels_per_second": round(size * size / 1e6 / seconds, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def git_commit():
+    # Commit of the checkout the benchmarked modules were imported from
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(esa_tiles.__file__), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["stage"], r["size"]): r for r in json.load(f)["results"]}
+
+    print(f"\n{'stage':<22}{'size':>7}{'base s':>10}{'new s':>10}{'speedup':>9}{'base MB':>10}{'new MB':>10}")
+    for result in report["results"]:
+        base = baseline.get((result["stage"], result["size"]))
+        if base is None:
+            continue
+        print(
+            f"{result['stage']:<22}{result['size']:>7}{base['seconds']:>10.2f}{result['seconds']:>10.2f}"
+            f"{base['seconds'] / result['seconds']:>8.2f}x"
+            f"{base['peak_rss_mb'] or 0:>10.0f}{result['peak_rss_mb'] or 0:>10.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ESA mask, stitching and heightmap raster stages.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Image sizes in pixels (1024..32768)")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "raster-benchmark"), help="Where synthetic inputs (several GB for the large sizes) are kept")
+    parser.add_argument("--output", default="raster-benchmark.json", help="JSON report path")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": [],
+    }
+
+    for size in args.sizes:
+        inputs = prepare_inputs(args.workdir, size, args.stages)
+
+        for stage in args.stages:
+            # A fresh process per run, so the peak RSS belongs to that stage alone
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                result = executor.submit(run_stage, stage, size, inputs, args.workdir).result()
+
+            print(f"{stage} @ {size}: {result['seconds']:.2f}s, peak RSS {result['peak_rss_mb']} MB")
+            report["results"].append(result)
+
+            # Write after every run so a long benchmark still leaves a report behind
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+
+    print(f"Report saved to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import numpy as np
+
+# Bulk access to mesh data as NumPy buffers through foreach_get / foreach_set.
+# Reading a 1M vertex mesh this way is a single copy instead of one Python object
+# per vertex or loop. The mesh must be in Object mode, edit-mode changes are not
+# visible in mesh data until then.
+#
+# Import it from a Blender script started with Common/ on PYTHONPATH (see README.md):
+#   from mesh_arrays import get_vertices, ...
+
+
+def get_vertices(mesh):
+    """(N, 3) float32 vertex coordinates, in object space."""
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    return co.reshape(-1, 3)
+
+
+def set_vertices(mesh, co):
+    """Write (N, 3) vertex coordinates back to the mesh."""
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(co, dtype=np.float32).ravel())
+    mesh.update()
+
+
+def get_loop_vertex_indices(mesh):
+    """(L,) int32 vertex index of every loop (face corner)."""
+    indices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", indices)
+    return indices
+
+
+def get_polygons(mesh):
+    """(P,) int32 loop_start and (P,) int32 loop_total of every polygon."""
+    loop_start = np.empty(len(mesh.polygons), dtype=np.int32)
+    loop_total = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    return loop_start, loop_total
+
+
+def get_polygon_vertex_indices(mesh):
+    """List of int32 vertex index arrays, one per polygon."""
+    loop_start, loop_total = get_polygons(mesh)
+    return np.split(get_loop_vertex_indices(mesh), loop_start[1:])
+
+
+def get_triangles(mesh):
+    """(T, 3) int32 vertex indices of the mesh's loop triangles."""
+    mesh.calc_loop_triangles()
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    return triangles.reshape(-1, 3)
+
+
+def _uv_layer(mesh, uv_layer):
+    if uv_layer is None:
+        return mesh.uv_layers.active
+    if isinstance(uv_layer, str):
+        return mesh.uv_layers[uv_layer]
+    return uv_layer
+
+
+def get_uvs(mesh, uv_layer=None):
+    """(L, 2) float32 UVs of every loop, from the given (or active) UV layer."""
+    layer = _uv_layer(mesh, uv_layer)
+    uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    layer.data.foreach_get("uv", uvs)
+    return uvs.reshape(-1, 2)
+
+
+def set_uvs(mesh, uvs, uv_layer=None):
+    """Write (L, 2) UVs back to the given (or active) UV layer."""
+    layer = _uv_layer(mesh, uv_layer)
+    layer.data.foreach_set("uv", np.ascontiguousarray(uvs, dtype=np.float32).ravel())
+    mesh.update()
@@ -0,0 +1,28 @@
+# The 16x16 grid the terrain is cut into, and where each cell lands in the UDIM textures.
+# Shared by everything that names tiles by `{quadrant}_{udim}` (ESA textures and masks,
+# height tiles, terrain meshes) so they stay in step.
+
+# 16x16 grid over the whole area, 8x8 UDIM tiles per quadrant
+GRID_SEGMENTS = 16
+QUADRANT_SEGMENTS = GRID_SEGMENTS // 2
+
+# Quadrant remapping: 1→2, 2→4, 3→1, 4→3
+QUADRANT_MAP = {1: 2, 2: 4, 3: 1, 4: 3}
+
+
+def get_quadrant_and_udim(i, j):
+    """Map a cell of the 16x16 grid (i along X from the west, j along Y from the south) to (quadrant, udim)."""
+    if i < QUADRANT_SEGMENTS and j < QUADRANT_SEGMENTS:
+        quadrant = 1
+    elif i < QUADRANT_SEGMENTS and j >= QUADRANT_SEGMENTS:
+        quadrant = 2
+    elif i >= QUADRANT_SEGMENTS and j < QUADRANT_SEGMENTS:
+        quadrant = 3
+    else:
+        quadrant = 4
+
+    local_i = i % QUADRANT_SEGMENTS
+    local_j = j % QUADRANT_SEGMENTS
+
+    udim = 1001 + (QUADRANT_SEGMENTS - 1 - local_i) * 10 + local_j  # ccw 90 DEGREES
+    return QUADRANT_MAP[quadrant], udim
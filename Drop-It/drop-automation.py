@@ -1,6 +1,16 @@
 import bpy
 import time
 
+import numpy as np
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+
+# Needs Drop-It/, Common/ and HeightMap/ on PYTHONPATH (see README.md):
+#   blender --python-use-system-env map.blend --python Drop-It/drop-automation.py
+
+from mesh_arrays import get_vertices, set_vertices
+from terrain_snap import OFFSET_Z, PLACEMENTS, GridTerrain, base_rings, drop_offsets, lowest_points, placement_offsets, to_world
+
 # Flip Terrain on Z-scale
 bpy.data.objects["Terrain"].scale[2] = -1
 
@@ -13,63 +23,130 @@ def get_collection_by_name(collection_name):
         print(f"Collection '{collection_name}' not found.")
         return None
 
-   
-def simulate_drop_it(obj):
-    if not obj:
-        print("No object provided to simulate Drop It.")
-        return
 
-    bpy.context.view_layer.objects.active = obj
-    obj.select_set(True)
-
-    # Create an override context for the 3D Viewport
-    for area in bpy.context.window.screen.areas:
-        if area.type == 'VIEW_3D':
-            with bpy.context.temp_override(area=area):
-                try:
-                    # Call the 'DROP IT' operator
-                    bpy.ops.object.drop_it(drop_by='lw_vertex', offset_z=0.1)
-                    print(f"'Drop It' applied to: {obj.name}")
-                except RuntimeError as e:
-                    print(f"Failed to apply 'Drop It' to {obj.name}: {e}")
-            break
+def terrain_sampler(terrain):
+    """
+    Function of (x, y) arrays returning the terrain height under them (NaN where there is none).
+
+    Both paths read the evaluated terrain (modifiers applied), so they see the same
+    surface. Regular-grid terrains are sampled from a height grid in NumPy, in one
+    batch. Anything else is raycast straight down against a BVH tree built once,
+    but one point at a time: mathutils has no batched raycast, so that path still
+    makes a Python call per point.
+    """
+    # Same surface the Drop It operator hits: the evaluated terrain in world space, flipped scale included
+    bpy.context.view_layer.update()
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    evaluated = terrain.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+    try:
+        vertices = to_world(get_vertices(mesh), evaluated.matrix_world)
+    finally:
+        evaluated.to_mesh_clear()
+
+    grid = GridTerrain.from_vertices(vertices)
+    if grid is not None:
+        print(f"Sampling the terrain as a {grid.heights.shape[1]} x {grid.heights.shape[0]} height grid")
+        return grid.sample
+
+    print("Irregular terrain, raycasting every point against a BVH tree")
+    bvh = BVHTree.FromObject(terrain, depsgraph)
+    matrix = evaluated.matrix_world.copy()
+    inverse = matrix.inverted()
+    top = float(np.max(vertices[:, 2])) + 1.0
+    down = (inverse.to_3x3() @ Vector((0.0, 0.0, -1.0))).normalized()
+
+    def sample(x, y):
+        heights = np.full(len(x), np.nan)
+        for k, (px, py) in enumerate(zip(x, y)):
+            # The tree is in terrain object space
+            hit, _, _, _ = bvh.ray_cast(inverse @ Vector((px, py, top)), down)
+            if hit is not None:
+                heights[k] = (matrix @ hit).z
+        return heights
+
+    return sample
+
+
+def conform_base_rings(objects, offsets, indices, ground, groups, offset_z=OFFSET_Z):
+    """Move every base ring vertex of the (already placed) objects straight up or down onto the ground under it."""
+    ground_by_object = np.split(ground, np.cumsum(np.bincount(groups, minlength=len(objects)))[:-1])
+    for obj, offset, index, object_ground in zip(objects, offsets, indices, ground_by_object):
+        if np.isnan(offset):
+            continue
+        vertices = get_vertices(obj.data).astype(np.float64)
+        matrix = np.array(obj.matrix_world)
+        world_z = to_world(vertices[index], matrix)[:, 2]
+        move = np.nan_to_num(object_ground + offset_z - world_z)
+
+        # A world Z move in object space, for any rotation or scale of the object
+        z_axis = np.linalg.inv(matrix[:3, :3])[:, 2]
+        vertices[index] += move[:, None] * z_axis
+        set_vertices(obj.data, vertices)
+
+
+def drop_objects(objects, terrain, offset_z=OFFSET_Z, placement="lowest_vertex"):
+    """
+    Drop every object onto the terrain, by its lowest vertex like Drop It's drop_by='lw_vertex' or by its footprint.
+
+    The vertices of all objects are gathered first and the terrain is sampled under
+    all of them in one batch, then each object is moved up or down so its base sits
+    offset_z above the ground. With a footprint placement ("min", "median" or
+    "conform", see terrain_snap.PLACEMENTS) the ground is sampled under every base
+    ring vertex; "conform" then also moves each of those vertices onto the ground,
+    so buildings on slopes neither float nor sink. Objects off the terrain are left alone.
+    """
+    if placement not in PLACEMENTS:
+        raise ValueError("Unknown placement.")
+
+    start = time.perf_counter()
+    sample = terrain_sampler(terrain)
+    world_vertices = [to_world(get_vertices(obj.data), obj.matrix_world) for obj in objects]
+
+    if placement == "lowest_vertex":
+        lowest = lowest_points(world_vertices)
+        offsets = drop_offsets(sample(lowest[:, 0], lowest[:, 1]), lowest[:, 2], offset_z)
     else:
-        print("No VIEW_3D area found in the current context.")
+        indices, points, groups = base_rings(world_vertices)
+        ground = sample(points[:, 0], points[:, 1])
+        offsets = placement_offsets(ground, points, groups, len(objects), placement, offset_z)
+        print(f"Sampled the terrain under {len(points)} footprint vertices")
+
+    dropped = 0
+    for obj, offset in zip(objects, offsets):
+        if np.isnan(offset):
+            print(f"No terrain under {obj.name}, skipped")
+            continue
+        matrix = obj.matrix_world.copy()
+        matrix.translation.z += float(offset)
+        obj.matrix_world = matrix
+        dropped += 1
 
+    if placement == "conform":
+        bpy.context.view_layer.update()
+        conform_base_rings(objects, offsets, indices, ground, groups, offset_z)
 
-    
-    
-def hide_all_meshes(objects):
-    for obj in objects:
-        if obj.type == 'MESH':
-            obj.hide_set(True)
+    print(f"Dropped {dropped}/{len(objects)} objects ({placement}) in {time.perf_counter() - start:.2f}s")
 
 
-def process_view(collection_name):
+def process_view(collection_name, terrain_name="Terrain", placement="lowest_vertex"):
     # Get the Collection
     osm_buildings_collection = get_collection_by_name(collection_name)
-    
+
     if not osm_buildings_collection:
         return
-    
-    if osm_buildings_collection:    
-        # Get all mesh objects in the scene
-        mesh_objects = [obj for obj in osm_buildings_collection.objects if obj.type == 'MESH']
-        
-        # Hide all meshes
-        hide_all_meshes(osm_buildings_collection.objects)
-    
-        for obj in mesh_objects:
-            # Show the mesh
-            obj.hide_set(False)
-            simulate_drop_it(obj)
-    
-            time.sleep(0.5)
-    
-            # Hide the mesh again
-            obj.hide_set(True)
-            
-            
+
+    terrain = bpy.data.objects.get(terrain_name)
+    if terrain is None:
+        print(f"Terrain '{terrain_name}' not found.")
+        return
+
+    # Get all mesh objects in the collection
+    mesh_objects = [obj for obj in osm_buildings_collection.objects if obj.type == 'MESH' and len(obj.data.vertices)]
+    drop_objects(mesh_objects, terrain, placement=placement)
+
+
 # Run the function
 collection_name = "map.osm_buildings"
-process_view(collection_name)
+placement = "lowest_vertex"  # Or "min", "median" or "conform" to place buildings by their whole footprint
+process_view(collection_name, placement=placement)
@@ -0,0 +1,127 @@
+import numpy as np
+
+# Snapping objects onto the terrain in batches, NumPy only: the terrain is turned into a
+# height grid once and sampled for any number of points in one call, instead of running
+# the Drop It operator (one raycast and one viewport update) per building.
+
+from heightmap_grid import regular_grid_heights, sample_points
+
+# Gap left between a building and the terrain, as Drop It's offset_z
+OFFSET_Z = 0.1
+
+# Vertices this close (in Z) to an object's lowest vertex form its base ring
+BASE_TOLERANCE = 0.01
+
+# "lowest_vertex" drops by the lowest vertex like Drop It, "min" / "median" put the base
+# at the lowest / median ground height under the footprint, "conform" also moves every
+# base ring vertex onto the ground under it
+PLACEMENTS = ("lowest_vertex", "min", "median", "conform")
+
+
+class GridTerrain:
+    """
+    Heights of a regular-grid terrain (like Blosm's) over its XY extent, rows going up in Y.
+
+    `sample` interpolates bilinearly at any number of (x, y) points and returns NaN
+    outside the terrain.
+    """
+
+    def __init__(self, heights, x_min, x_max, y_min, y_max):
+        self.heights = heights
+        self.x_min, self.x_max = x_min, x_max
+        self.y_min, self.y_max = y_min, y_max
+
+    @classmethod
+    def from_vertices(cls, vertices):
+        """From (N, 3) world-space terrain vertices, or None if they do not form a regular grid."""
+        heights = regular_grid_heights(vertices)
+        if heights is None:
+            return None
+        x_min, y_min = np.min(vertices[:, :2], axis=0)
+        x_max, y_max = np.max(vertices[:, :2], axis=0)
+        return cls(heights, float(x_min), float(x_max), float(y_min), float(y_max))
+
+    def sample(self, x, y):
+        rows, cols = self.heights.shape
+        x = (np.asarray(x, dtype=np.float64) - self.x_min) / (self.x_max - self.x_min) * (cols - 1)
+        y = (np.asarray(y, dtype=np.float64) - self.y_min) / (self.y_max - self.y_min) * (rows - 1)
+        return sample_points(self.heights, x, y)
+
+
+def to_world(vertices, matrix_world):
+    """(N, 3) object-space vertices to world space with a 4x4 matrix (anything np.array accepts)."""
+    matrix = np.asarray(matrix_world, dtype=np.float64)
+    return vertices @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def lowest_points(world_vertices):
+    """(B, 3) lowest vertex of every object, from a list of (N, 3) world-space vertex arrays."""
+    return np.array([vertices[np.argmin(vertices[:, 2])] for vertices in world_vertices], dtype=np.float64)
+
+
+def drop_offsets(ground, lowest_z, offset_z=OFFSET_Z):
+    """Z moves that put every object's lowest vertex offset_z above the ground under it (NaN where there is none)."""
+    return np.asarray(ground) + offset_z - np.asarray(lowest_z)
+
+
+def base_rings(world_vertices, tolerance=BASE_TOLERANCE):
+    """
+    Base ring (footprint) vertices of every object, flattened for one sampling pass.
+
+    Returns (indices, points, groups): per object the indices of its base vertices,
+    the (M, 3) world positions of all of them and the (M,) object each belongs to.
+    """
+    indices = []
+    for vertices in world_vertices:
+        z = vertices[:, 2]
+        indices.append(np.flatnonzero(z <= z.min() + tolerance))
+    points = np.concatenate([vertices[index] for vertices, index in zip(world_vertices, indices)]).astype(np.float64)
+    groups = np.repeat(np.arange(len(indices)), [len(index) for index in indices])
+    return indices, points, groups
+
+
+def group_min(values, groups, count):
+    """Smallest non-NaN value of every group 0..count-1 (NaN for groups without one)."""
+    result = np.full(count, np.inf)
+    valid = ~np.isnan(values)
+    np.minimum.at(result, groups[valid], values[valid])
+    result[np.isinf(result)] = np.nan
+    return result
+
+
+def group_median(values, groups, count):
+    """Median of the non-NaN values of every group 0..count-1 (NaN for groups without any)."""
+    valid = ~np.isnan(values)
+    values, groups = values[valid], groups[valid]
+    order = np.lexsort((values, groups))
+    values = values[order]
+
+    sizes = np.bincount(groups, minlength=count)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    has = sizes > 0
+    low = starts[has] + (sizes[has] - 1) // 2
+    high = starts[has] + sizes[has] // 2
+
+    result = np.full(count, np.nan)
+    result[has] = (values[low] + values[high]) / 2
+    return result
+
+
+def placement_offsets(ground, points, groups, count, placement="median", offset_z=OFFSET_Z):
+    """
+    Z moves that put every object's base offset_z above the ground sampled under its base ring.
+
+    "min" uses the lowest ground under the footprint, so nothing floats and the
+    uphill side sinks in; "median" and "conform" use the median. NaN where no base
+    vertex is over the terrain.
+    """
+    if placement == "min":
+        target = group_min(ground, groups, count)
+    elif placement in ("median", "conform"):
+        target = group_median(ground, groups, count)
+    else:
+        raise ValueError("Unknown placement.")
+
+    base_z = np.full(count, np.nan)
+    np.fmin.at(base_z, groups, points[:, 2])
+    return target + offset_z - base_z
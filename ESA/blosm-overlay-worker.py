@@ -0,0 +1,223 @@
+import bpy
+import json
+import os
+import queue
+import shutil
+import struct
+import sys
+import threading
+import time
+import zlib
+
+# Long-lived Blosm overlay worker, started once per batch by esa_overlay_worker.BlosmOverlayWorker:
+#   blender -b --python blosm-overlay-worker.py -- <blosm overlay.png path>
+# Jobs arrive as JSON lines on stdin: {"min_lat", "max_lat", "min_lon", "max_lon", "output"}
+# Every job is answered with one "RESULT {json}" line on stdout. An empty line quits Blender.
+#
+# Blosm's overlay import goes on after import_data returns (the baseline waited for its
+# "Overlay import is finished!" report), so a job is only done once no Blosm modal operator
+# is running and overlay.png has been rewritten as a complete PNG. Without -b
+# (background=False) jobs are served from a timer while Blender's event loop drives the
+# import. With -b there is no event loop, so jobs are served in a plain loop and only an
+# import that has written its overlay by the time import_data returns can succeed.
+
+RESULT_PREFIX = "RESULT "
+POLL_INTERVAL = 0.5  # Seconds between checks for new jobs / finished overlays
+JOB_TIMEOUT = 1800  # Seconds before an overlay import is given up on
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+READ_SIZE = 1024 * 1024
+
+blosm_overlay_file_path = sys.argv[-1]
+
+jobs = queue.Queue()
+current = None
+
+
+def read_jobs():
+    # Runs on its own thread so Blender's main loop keeps going while we wait for input
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            break
+        jobs.put(json.loads(line))
+    jobs.put(None)
+
+
+def reply(job, **result):
+    print(RESULT_PREFIX + json.dumps({"id": job.get("id"), **result}), flush=True)
+
+
+def overlay_mtime():
+    return os.path.getmtime(blosm_overlay_file_path) if os.path.isfile(blosm_overlay_file_path) else 0
+
+
+def png_complete(path):
+    """Whether a PNG file is whole: every chunk's CRC matches, the image data inflates to its end and IEND is there."""
+    inflater = zlib.decompressobj()
+    with open(path, "rb") as f:
+        if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+            return False
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return False
+            length, chunk_type = struct.unpack(">I4s", header)
+
+            crc = zlib.crc32(chunk_type)
+            remaining = length
+            while remaining:
+                data = f.read(min(remaining, READ_SIZE))
+                if not data:
+                    return False
+                remaining -= len(data)
+                crc = zlib.crc32(data, crc)
+                if chunk_type == b"IDAT":
+                    # Inflate a bounded amount at a time, only to prove the stream is intact
+                    while data:
+                        inflater.decompress(data, READ_SIZE)
+                        data = inflater.unconsumed_tail
+
+            footer = f.read(4)
+            if len(footer) < 4 or struct.unpack(">I", footer)[0] != crc:
+                return False
+            if chunk_type == b"IEND":
+                return inflater.eof
+
+
+def blosm_running():
+    # Window.modal_operators (Blender 4.2+) lists the modal operators still running
+    return any(
+        operator.bl_idname.lower().startswith(("blosm.", "blosm_ot_"))
+        for window in bpy.context.window_manager.windows
+        for operator in window.modal_operators
+    )
+
+
+def start_job(job):
+    """Set up Blosm for the job's bbox and start the overlay import. Returns the operator's result."""
+    blosm = bpy.data.scenes['Scene'].blosm
+
+    blosm.minLat = float(job["min_lat"])
+    blosm.maxLat = float(job["max_lat"])
+    blosm.minLon = float(job["min_lon"])
+    blosm.maxLon = float(job["max_lon"])
+
+    # Adding Overlay
+    blosm.dataType = 'overlay'
+    blosm.overlayType = 'esa-local'
+    blosm.saveOverlayToFile = True
+
+    job["started"] = time.time()
+    job["mtime"] = overlay_mtime()
+    job["checked"] = None
+
+    windows = bpy.context.window_manager.windows
+    if not windows:
+        return bpy.ops.blosm.import_data()
+    # Blosm's modal import adds its timer to context.window, which timers don't set
+    with bpy.context.temp_override(window=windows[0]):
+        return bpy.ops.blosm.import_data()
+
+
+def overlay_ready(job):
+    """Whether Blosm is done with the job's import and overlay.png is a new, complete PNG."""
+    if blosm_running() or overlay_mtime() <= job["mtime"]:
+        return False
+    # Only decode the file again once it has changed since the last failed check
+    stat = os.stat(blosm_overlay_file_path)
+    state = (stat.st_mtime, stat.st_size)
+    if state == job["checked"]:
+        return False
+    job["checked"] = state
+    return png_complete(blosm_overlay_file_path)
+
+
+def finish_job(job):
+    """Copy the finished overlay to the job's output and answer it."""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(job["output"])), exist_ok=True)
+        overlay_file = shutil.copyfile(blosm_overlay_file_path, job["output"])
+        reply(job, overlay=overlay_file, seconds=time.time() - job["started"])
+    except Exception as e:
+        reply(job, error=str(e))
+    cleanup()
+
+
+def cleanup():
+    # Drop what the import added so memory doesn't grow from job to job
+    for obj in list(bpy.data.objects):
+        if obj.name not in ("Camera", "Light", "Cube"):
+            bpy.data.objects.remove(obj, do_unlink=True)
+    for image in list(bpy.data.images):
+        if image.users == 0:
+            bpy.data.images.remove(image)
+    bpy.ops.outliner.orphans_purge(do_recursive=True)
+
+
+def serve_background():
+    # No event loop and no window with -b: the overlay has to be written when the operator returns
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+
+        try:
+            result = start_job(job)
+        except Exception as e:
+            reply(job, error=str(e))
+            continue
+
+        if 'CANCELLED' in result:
+            reply(job, error="Blosm cancelled the overlay import")
+            cleanup()
+        elif overlay_ready(job):
+            finish_job(job)
+        else:
+            reply(job, error="Blosm did not write the overlay without a window, start the worker with background=False")
+            cleanup()
+
+
+def poll_jobs():
+    global current
+
+    if current is None:
+        try:
+            job = jobs.get_nowait()
+        except queue.Empty:
+            return POLL_INTERVAL
+
+        if job is None:
+            bpy.ops.wm.quit_blender()
+            return None
+
+        try:
+            result = start_job(job)
+        except Exception as e:
+            reply(job, error=str(e))
+            return POLL_INTERVAL
+
+        if 'CANCELLED' in result:
+            reply(job, error="Blosm cancelled the overlay import")
+            cleanup()
+        else:
+            # FINISHED or RUNNING_MODAL, the overlay is written later either way
+            current = job
+        return POLL_INTERVAL
+
+    if overlay_ready(current):
+        finish_job(current)
+        current = None
+    elif time.time() - current["started"] > JOB_TIMEOUT:
+        reply(current, error="Overlay import timed out")
+        cleanup()
+        current = None
+
+    return POLL_INTERVAL
+
+
+threading.Thread(target=read_jobs, daemon=True).start()
+print("Blosm overlay worker ready", flush=True)
+if bpy.app.background:
+    serve_background()
+else:
+    bpy.app.timers.register(poll_jobs, first_interval=POLL_INTERVAL, persistent=True)
@@ -0,0 +1,211 @@
+import numpy as np
+from PIL import Image
+
+from esa_overview import OverviewPyramid
+from esa_raster import PngStripWriter, STRIP_ROWS, raster_size, read_strips
+
+# Color Coding of the ESA World Cover [https://worldcover2020.esa.int/data/docs/WorldCover_PUM_V1.1.pdf]
+COLOR_CODING = {
+    "tree_cover": [0, 100, 0],
+    "shrub_land": [255, 187, 34],
+    "grass_land": [255, 255, 76],
+    "crop_land": [240, 150, 255],
+    "built_up": [250, 0, 0],
+    "bare_sparse": [180, 180, 180],
+    "snow_ice": [240, 240, 240],
+    "water_bodies": [0, 100, 200],
+    "herbaceous_wetland": [0, 150, 160],
+    "mangroves": [0, 207, 117],
+    "moss_lichen": [250, 230, 160],
+}
+RGB_TOLERANCE = 40  # Allow a tolerance range of +/- 40 for each RGB channel
+
+# Rows classified at a time, keeps the (rows, width, classes) temporaries small
+BLOCK_ROWS = 512
+
+# Label map pixels hold 0 for unclassified, otherwise 1 + the class's position in the color coding
+LABEL_MAP_NAME = "land_cover_labels.png"
+
+
+def classify_pixels(img_array, color_coding=COLOR_CODING, tolerance=RGB_TOLERANCE):
+    """Return a (H, W, classes) boolean array, True where a pixel is within tolerance of a class color."""
+    palette = np.array(list(color_coding.values()), dtype=np.int16)
+
+    # int16 so the subtraction can't wrap around like uint8 would
+    rgb = img_array[..., :3].astype(np.int16)
+
+    # Broadcast (H, W, 1, 3) against (classes, 3) -> (H, W, classes, 3)
+    diff = np.abs(rgb[:, :, None, :] - palette[None, None, :, :])
+    return np.all(diff <= tolerance, axis=-1)
+
+
+def classify_overlay(img_array, color_coding=COLOR_CODING, tolerance=RGB_TOLERANCE, block_rows=BLOCK_ROWS):
+    """
+    Build every class mask from a single pass over an RGB array.
+
+    Gives the same result as running `within_tolerance` per pixel for each class,
+    but reads the image once and checks all classes together with broadcasting.
+    Returns a dict of land_type -> uint8 mask (255 where the class matches, 0 elsewhere).
+    """
+    height, width = img_array.shape[:2]
+    masks = {land_type: np.zeros((height, width), dtype=np.uint8) for land_type in color_coding}
+
+    for row in range(0, height, block_rows):
+        matches = classify_pixels(img_array[row:row + block_rows], color_coding, tolerance)
+        for k, land_type in enumerate(color_coding):
+            masks[land_type][row:row + block_rows][matches[:, :, k]] = 255
+
+    return masks
+
+
+def classify_labels(img_array, color_coding=COLOR_CODING, tolerance=RGB_TOLERANCE, block_rows=BLOCK_ROWS):
+    """
+    Return a (H, W) uint8 label array: 0 where no class matches, else 1 + the class index.
+
+    Where the tolerance ranges of two classes overlap, the class listed first in
+    color_coding wins.
+    """
+    labels = np.zeros(img_array.shape[:2], dtype=np.uint8)
+
+    for row in range(0, labels.shape[0], block_rows):
+        matches = classify_pixels(img_array[row:row + block_rows], color_coding, tolerance)
+        # argmax picks the first matching class
+        labels[row:row + block_rows] = np.where(matches.any(axis=-1), matches.argmax(axis=-1) + 1, 0)
+
+    return labels
+
+
+def create_masks(input_image_path, output_folder, color_coding=COLOR_CODING, tolerance=RGB_TOLERANCE):
+    """Classify the overlay once and save one `<land_type>.png` mask per class into output_folder."""
+    # Open the image & convert to RGB
+    img = Image.open(input_image_path).convert("RGB")
+    img_array = np.array(img)
+    img.close()
+
+    masks = classify_overlay(img_array, color_coding, tolerance)
+
+    for land_type, mask_image in masks.items():
+        Image.fromarray(mask_image).save(f"{output_folder}/{land_type}.png")
+        print(f"Saved mask: {land_type}")
+
+    return masks
+
+
+def stream_masks(
+    input_image_path,
+    output_folder,
+    color_coding=COLOR_CODING,
+    tolerance=RGB_TOLERANCE,
+    strip_rows=STRIP_ROWS,
+    overviews=0,
+    overlay_overviews=False,
+):
+    """
+    Strip-streamed version of `create_masks` for overlays too large to load at once.
+
+    Reads the overlay in horizontal strips, classifies each strip and appends it to
+    every `<land_type>.png` as it goes, so memory depends on the strip size only.
+    With overviews=N each mask also gets N levels of majority-filtered overviews
+    (`<land_type>_ov2.png` ... see esa_overview), and with overlay_overviews=True
+    the overlay's own mean-filtered overviews are written from the same read.
+    """
+    width, height = raster_size(input_image_path)
+
+    writers = {
+        land_type: PngStripWriter(f"{output_folder}/{land_type}.png", width, height, "L")
+        for land_type in color_coding
+    }
+    pyramids = {}
+    if overviews:
+        pyramids = {
+            land_type: OverviewPyramid(f"{output_folder}/{land_type}.png", width, height, overviews, "L", categorical=True)
+            for land_type in color_coding
+        }
+    overlay_pyramid = OverviewPyramid(input_image_path, width, height, overviews) if overviews and overlay_overviews else None
+
+    for y, strip in read_strips(input_image_path, strip_rows):
+        masks = classify_overlay(strip, color_coding, tolerance)
+        for land_type, writer in writers.items():
+            writer.write(masks[land_type])
+        for land_type, pyramid in pyramids.items():
+            pyramid.write(masks[land_type])
+        if overlay_pyramid:
+            overlay_pyramid.write(strip)
+        print(f"Classified rows {y}-{y + len(strip)} of {height}")
+
+    for land_type, writer in writers.items():
+        writer.close()
+        if land_type in pyramids:
+            pyramids[land_type].close()
+        print(f"Saved mask: {land_type}")
+
+    if overlay_pyramid:
+        overlay_pyramid.close()
+        print(f"Saved {overviews} overviews of {input_image_path}")
+
+
+def stream_label_map(
+    input_image_path,
+    output_path,
+    color_coding=COLOR_CODING,
+    tolerance=RGB_TOLERANCE,
+    strip_rows=STRIP_ROWS,
+    overviews=0,
+):
+    """
+    Strip-streamed classification into a single palette PNG instead of one mask per class.
+
+    Each pixel holds its class id (see `classify_labels`) and the palette shows the
+    class colors, so the file still previews like the overlay. With overviews=N the
+    label map also gets N levels of majority-filtered overviews, so every overview
+    pixel is still a valid class id.
+    """
+    width, height = raster_size(input_image_path)
+    palette = [[0, 0, 0]] + list(color_coding.values())
+
+    with PngStripWriter(output_path, width, height, "P", palette=palette) as writer:
+        pyramid = OverviewPyramid(output_path, width, height, overviews, "P", palette, categorical=True) if overviews else None
+        for y, strip in read_strips(input_image_path, strip_rows):
+            labels = classify_labels(strip, color_coding, tolerance)
+            writer.write(labels)
+            if pyramid:
+                pyramid.write(labels)
+            print(f"Classified rows {y}-{y + len(strip)} of {height}")
+        if pyramid:
+            pyramid.close()
+
+    print(f"Saved label map: {output_path}")
+
+
+class LabelMap:
+    """
+    Read a label map written by `stream_label_map` and hand out per-class boolean masks.
+
+    The label image is decoded once on first use, each class mask is only computed
+    when asked for. `mask_strips` walks the file in strips instead, for maps too
+    large to hold in memory.
+    """
+
+    def __init__(self, path, color_coding=COLOR_CODING):
+        self.path = path
+        self.class_ids = {land_type: k + 1 for k, land_type in enumerate(color_coding)}
+        self._labels = None
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            with Image.open(self.path) as img:
+                self._labels = np.asarray(img)
+        return self._labels
+
+    def mask(self, land_type):
+        """Boolean (H, W) mask of a single class."""
+        return self.labels == self.class_ids[land_type]
+
+    def __getitem__(self, land_type):
+        return self.mask(land_type)
+
+    def mask_strips(self, land_type, strip_rows=STRIP_ROWS):
+        """Yield (y, boolean strip) for a single class without decoding the whole map."""
+        for y, strip in read_strips(self.path, strip_rows, mode="P"):
+            yield y, strip == self.class_ids[land_type]
@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blosm-overlay-worker.py")
+RESULT_PREFIX = "RESULT "
+
+
+class BlosmOverlayWorker:
+    """
+    One long-lived Blender process that imports ESA overlays through Blosm, bbox after bbox.
+
+    Blender starts and loads its addons once; every `render` call then sends a job
+    to blosm-overlay-worker.py over stdin and gets the copied overlay path back, so
+    there is no per-area launch and no scraping of Blosm's log messages.
+
+    Blosm's overlay import carries on after import_data returns, driven by Blender's
+    event loop with context.window set, so a job is only answered once the import is
+    over and overlay.png is a complete PNG. Pass background=False for that: Blender
+    opens its UI and the worker runs the import with its first window in the context.
+    With the default (-b) no window opens and no display is needed, but the import
+    only succeeds if Blosm writes the overlay before import_data returns, which has
+    not been shown to work; every other job is answered with an error.
+    """
+
+    def __init__(self, blender_path, blosm_overlay_file_path, worker_script=WORKER_SCRIPT, background=True, verbose=False):
+        self.verbose = verbose
+        self.jobs_sent = 0
+        command = [blender_path, '-b'] if background else [blender_path]
+        self.process = subprocess.Popen(
+            command + ['--python', worker_script, '--', blosm_overlay_file_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+
+    def render(self, min_lat, max_lat, min_lon, max_lon, output_path):
+        """Import the overlay for a bbox and copy it to output_path. Returns the copied file's path."""
+        self.jobs_sent += 1
+        job = {
+            "id": self.jobs_sent,
+            "min_lat": min_lat,
+            "max_lat": max_lat,
+            "min_lon": min_lon,
+            "max_lon": max_lon,
+            "output": os.path.abspath(output_path),
+        }
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+
+        while True:
+            output = self.process.stdout.readline()
+            if output == '' and self.process.poll() is not None:
+                raise RuntimeError("Blender exited before the overlay was imported")
+
+            if not output.startswith(RESULT_PREFIX):
+                if self.verbose and output.strip():
+                    print(output.strip())
+                continue
+
+            result = json.loads(output[len(RESULT_PREFIX):])
+            if result["id"] != job["id"]:
+                continue
+            if "error" in result:
+                raise RuntimeError(f"Overlay import failed: {result['error']}")
+
+            print(f"Overlay for {min_lat}, {max_lat}, {min_lon}, {max_lon} ready in {result['seconds']:.1f}s")
+            return result["overlay"]
+
+    def close(self):
+        if self.process.poll() is None:
+            # An empty line tells the worker to quit Blender
+            self.process.stdin.write("\n")
+            self.process.stdin.flush()
+            try:
+                self.process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                self.process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+
+from esa_raster import PngStripWriter, STRIP_ROWS, raster_size, read_strips
+
+# Number of 2x overview levels: 1/2, 1/4, 1/8 and 1/16
+OVERVIEW_LEVELS = 4
+
+# Overviews sit next to the image they were built from, e.g. overlay_ov16.png
+OVERVIEW_NAME = "{stem}_ov{factor}.png"
+
+
+def overview_path(path, factor):
+    """Path of the 1/factor overview of an image."""
+    stem = os.path.splitext(path)[0]
+    return OVERVIEW_NAME.format(stem=stem, factor=factor)
+
+
+def best_overview(path, max_size):
+    """
+    The smallest existing overview of an image that is still at least max_size pixels on its long side.
+
+    Falls back to the image itself when no overview is small enough, so previews
+    and low-res LOD textures can always just open the returned path.
+    """
+    best = path
+    factor = 2
+    while os.path.isfile(overview_path(path, factor)):
+        if max(raster_size(overview_path(path, factor))) < max_size:
+            break
+        best = overview_path(path, factor)
+        factor *= 2
+    return best
+
+
+def _pair_rows(rows):
+    """Split an even number of rows into the top and bottom row of each pair, padding odd widths."""
+    if rows.shape[1] % 2:
+        rows = np.concatenate([rows, rows[:, -1:]], axis=1)
+    return rows[0::2], rows[1::2]
+
+
+def mean_reduce(rows):
+    """2x2 box filter for color images."""
+    top, bottom = _pair_rows(rows)
+    total = top[:, 0::2].astype(np.uint16) + top[:, 1::2] + bottom[:, 0::2] + bottom[:, 1::2]
+    return ((total + 2) // 4).astype(np.uint8)
+
+
+def mode_reduce(rows):
+    """
+    2x2 majority filter for class ids and masks, so every output pixel is a class that was in its block.
+
+    Ties go to the first pixel of the block in reading order.
+    """
+    top, bottom = _pair_rows(rows)
+    block = np.stack([top[:, 0::2], top[:, 1::2], bottom[:, 0::2], bottom[:, 1::2]])
+    votes = (block[:, None] == block[None, :]).sum(axis=1)
+    return np.take_along_axis(block, votes.argmax(axis=0)[None], axis=0)[0]
+
+
+class OverviewPyramid:
+    """
+    Write the 2x-downsampled overviews of an image while its full-resolution rows stream past.
+
+    Feed it the same strips that go into the full-resolution image. Every level is
+    reduced from the level above it as soon as it has a pair of rows, and written
+    with its own PngStripWriter, so building the pyramid takes no extra read of the
+    full-resolution image and only a row per level is held back.
+    Set categorical=True for class ids and masks to reduce by majority instead of by mean.
+    """
+
+    def __init__(self, path, width, height, levels=OVERVIEW_LEVELS, mode="RGB", palette=None, categorical=False):
+        self.reduce = mode_reduce if categorical else mean_reduce
+        self.writers = []
+        self.carry = [None] * levels
+
+        factor = 1
+        for _ in range(levels):
+            factor *= 2
+            width, height = (width + 1) // 2, (height + 1) // 2
+            self.writers.append(PngStripWriter(overview_path(path, factor), width, height, mode, palette=palette))
+
+    def write(self, rows):
+        for level, writer in enumerate(self.writers):
+            if self.carry[level] is not None:
+                rows = np.concatenate([self.carry[level], rows])
+                self.carry[level] = None
+
+            # Odd row left over, keep it until the next strip
+            if len(rows) % 2:
+                self.carry[level] = rows[-1:]
+                rows = rows[:-1]
+            if len(rows) == 0:
+                return
+
+            rows = self.reduce(rows)
+            writer.write(rows)
+
+    def close(self):
+        # Flush what is left over at an odd image height, pairing the last row with itself
+        for level, writer in enumerate(self.writers):
+            rows, self.carry[level] = self.carry[level], None
+            if rows is not None:
+                if len(rows) % 2:
+                    rows = np.concatenate([rows, rows[-1:]])
+                rows = self.reduce(rows)
+                writer.write(rows)
+                if level + 1 < len(self.writers):
+                    below = self.carry[level + 1]
+                    self.carry[level + 1] = rows if below is None else np.concatenate([below, rows])
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for writer in self.writers:
+                writer.__exit__(exc_type, exc, tb)
+
+
+def build_overviews(image_path, levels=OVERVIEW_LEVELS, mode="RGB", palette=None, categorical=False, strip_rows=STRIP_ROWS):
+    """Build the overview pyramid of an existing image in one streaming read."""
+    width, height = raster_size(image_path)
+
+    with OverviewPyramid(image_path, width, height, levels, mode, palette, categorical) as pyramid:
+        for _, strip in read_strips(image_path, strip_rows, mode):
+            pyramid.write(strip)
+
+    print(f"Saved {levels} overviews of {image_path}")
@@ -0,0 +1,248 @@
+import os
+import struct
+import zlib
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Rows per strip when streaming large rasters
+STRIP_ROWS = 256
+
+# Number of samples per pixel for each PNG color type
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# PNG color type for each PIL mode the strip writer supports
+PNG_COLOR_TYPES = {"L": 0, "RGB": 2, "P": 3, "LA": 4, "RGBA": 6}
+
+
+def _read_chunk(f):
+    header = f.read(8)
+    if len(header) < 8:
+        return None, None
+    length, chunk_type = struct.unpack(">I4s", header)
+    data = f.read(length)
+    f.read(4)  # CRC
+    return chunk_type, data
+
+
+def _chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def _png_header(path):
+    """Return (width, height, bit_depth, color_type, interlace) of a PNG without decoding it."""
+    with open(path, "rb") as f:
+        if f.read(8) != PNG_SIGNATURE:
+            return None
+        chunk_type, data = _read_chunk(f)
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", data)
+        return width, height, bit_depth, color_type, interlace
+
+
+def raster_size(path):
+    """Return (width, height) of a .npy raster or image file without loading the pixels."""
+    if path.endswith(".npy"):
+        height, width = np.load(path, mmap_mode="r").shape[:2]
+        return width, height
+
+    header = _png_header(path)
+    if header:
+        return header[0], header[1]
+
+    with Image.open(path) as img:
+        return img.size
+
+
+def _iter_png_strips(path, strip_rows):
+    """
+    Decode a non-interlaced 8-bit PNG a few rows at a time.
+
+    The IDAT stream is inflated incrementally and every strip of still-filtered
+    scanlines is wrapped in a tiny stand-alone PNG (uncompressed) so PIL can do the
+    unfiltering in C. The previous strip's last row is prepended unfiltered, which
+    gives the Up/Average/Paeth filters of the first row the context they need.
+    """
+    with open(path, "rb") as f:
+        f.read(8)
+        header_chunks = []
+        first_idat = None
+        while True:
+            chunk_type, data = _read_chunk(f)
+            if chunk_type is None or chunk_type == b"IEND":
+                break
+            if chunk_type == b"IDAT":
+                first_idat = data
+                break
+            header_chunks.append((chunk_type, data))
+
+        ihdr = header_chunks[0][1]
+        width, height, bit_depth, color_type = struct.unpack(">IIBB", ihdr[:10])
+        stride = width * PNG_CHANNELS[color_type] + 1
+        extra_chunks = b"".join(_chunk(t, d) for t, d in header_chunks[1:])
+
+        def idat_data():
+            yield first_idat
+            while True:
+                chunk_type, data = _read_chunk(f)
+                if chunk_type is None or chunk_type == b"IEND":
+                    return
+                if chunk_type == b"IDAT":
+                    yield data
+
+        inflater = zlib.decompressobj()
+        pending = bytearray()
+        previous_row = None
+        y = 0
+        chunks = idat_data()
+
+        while y < height:
+            rows = min(strip_rows, height - y)
+            while len(pending) < rows * stride:
+                data = next(chunks, None)
+                if data is None:
+                    pending += inflater.flush()
+                    break
+                pending += inflater.decompress(data)
+
+            filtered = bytes(pending[:rows * stride])
+            del pending[:rows * stride]
+
+            if previous_row is not None:
+                filtered = b"\x00" + previous_row + filtered
+                strip_height = rows + 1
+            else:
+                strip_height = rows
+
+            strip_ihdr = struct.pack(">II", width, strip_height) + ihdr[8:]
+            strip_png = (
+                PNG_SIGNATURE
+                + _chunk(b"IHDR", strip_ihdr)
+                + extra_chunks
+                + _chunk(b"IDAT", zlib.compress(filtered, 0))
+                + _chunk(b"IEND", b"")
+            )
+
+            with Image.open(BytesIO(strip_png)) as img:
+                img.load()
+                strip = img.copy()
+
+            if previous_row is not None:
+                strip = strip.crop((0, 1, width, strip_height))
+
+            # Raw bytes of the last row become the unfiltered context for the next strip
+            previous_row = strip.crop((0, rows - 1, width, rows)).tobytes()
+
+            yield y, strip
+            y += rows
+
+
+def read_strips(path, strip_rows=STRIP_ROWS, mode="RGB"):
+    """
+    Yield (y, array) horizontal strips of a raster, converted to the given PIL mode.
+
+    Memory stays bounded for .npy rasters (memory-mapped) and for non-interlaced
+    8-bit PNGs (incremental decode). Anything else is opened with PIL in one go.
+    """
+    if path.endswith(".npy"):
+        raster = np.load(path, mmap_mode="r")
+        for y in range(0, raster.shape[0], strip_rows):
+            yield y, np.asarray(Image.fromarray(np.array(raster[y:y + strip_rows])).convert(mode))
+        return
+
+    header = _png_header(path)
+    if header and header[2] == 8 and header[4] == 0:
+        for y, strip in _iter_png_strips(path, strip_rows):
+            yield y, np.asarray(strip.convert(mode))
+        return
+
+    print(f"Streaming not supported for {path}, loading it whole")
+    with Image.open(path) as img:
+        img = img.convert(mode)
+        for y in range(0, img.size[1], strip_rows):
+            yield y, np.asarray(img.crop((0, y, img.size[0], min(y + strip_rows, img.size[1]))))
+
+
+def read_strips_with_halo(path, halo, strip_rows=STRIP_ROWS, mode="RGB"):
+    """
+    Yield (y, array, top) strips that carry up to `halo` extra rows from the neighbouring strips.
+
+    `top` is the number of halo rows above the strip (0 for the first one), so the
+    strip's own rows are array[top:top + rows]. Strips are yielded one strip late.
+    """
+    previous = None
+    previous_y = 0
+    previous_tail = None
+
+    for y, strip in read_strips(path, strip_rows, mode):
+        if previous is not None:
+            parts = [previous_tail, previous, strip[:halo]] if previous_tail is not None else [previous, strip[:halo]]
+            top = 0 if previous_tail is None else len(previous_tail)
+            yield previous_y, np.concatenate(parts), top
+            previous_tail = previous[-halo:]
+        previous, previous_y = strip, y
+
+    if previous is not None:
+        parts = [previous_tail, previous] if previous_tail is not None else [previous]
+        top = 0 if previous_tail is None else len(previous_tail)
+        yield previous_y, np.concatenate(parts), top
+
+
+class PngStripWriter:
+    """
+    Write a PNG top to bottom, one strip at a time, without holding the image in memory.
+
+    Rows are deflated as they arrive and flushed to disk as IDAT chunks.
+    Supports "L", "LA", "RGB", "RGBA" and "P" (with a palette) 8-bit images.
+    """
+
+    def __init__(self, path, width, height, mode="L", palette=None, compress_level=6):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.channels = PNG_CHANNELS[PNG_COLOR_TYPES[mode]]
+        self.compressor = zlib.compressobj(compress_level)
+
+        # Write to a temporary name so a half-written PNG never looks finished
+        self.tmp_path = f"{path}.part"
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(PNG_SIGNATURE)
+        self.file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, PNG_COLOR_TYPES[mode], 0, 0, 0)))
+        if mode == "P":
+            self.file.write(_chunk(b"PLTE", bytes(np.asarray(palette, dtype=np.uint8).ravel())))
+
+    def write(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(len(rows), self.width * self.channels)
+
+        # Prefix every scanline with filter type 0 (None)
+        filtered = np.zeros((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows
+
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            self.file.write(_chunk(b"IDAT", data))
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(_chunk(b"IDAT", self.compressor.flush()))
+        self.file.write(_chunk(b"IEND", b""))
+        self.file.close()
+
+        if self.rows_written != self.height:
+            raise ValueError(f"{self.path}: wrote {self.rows_written} rows, expected {self.height}")
+        os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.tmp_path)
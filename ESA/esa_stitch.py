@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from esa_overview import OverviewPyramid
+from esa_raster import PngStripWriter, STRIP_ROWS
+from esa_tiles import WORKERS, get_pixel_window, tiles_in_window
+
+
+def open_raster(raster_path, width, height):
+    """
+    Preallocate an RGBX memory-mapped .npy raster of the given size.
+
+    The fourth (padding) channel lets PIL map the raster without copying it,
+    which is what `save_raster` relies on for JPEG output.
+    """
+    return np.lib.format.open_memmap(raster_path, mode="w+", dtype=np.uint8, shape=(height, width, 4))
+
+
+def _paste_tile(raster, tile_path, tile_box, offset):
+    with Image.open(tile_path) as tile:
+        pixels = np.asarray(tile.crop(tile_box).convert("RGB"))
+    left, top = offset
+    raster[top:top + pixels.shape[0], left:left + pixels.shape[1], :3] = pixels
+
+
+def stitch_tiles_to_raster(cache, base_url, min_lat, max_lat, min_lon, max_lon, zoom, raster_path, workers=WORKERS):
+    """
+    Stitch the bbox straight into a memory-mapped raster at raster_path.
+
+    The raster covers exactly the bbox's pixel window, and only the part of each
+    edge tile inside that window is copied, so the uncropped mosaic is never built.
+    Tiles are decoded on a thread pool and written into the raster as soon as
+    they are decoded, so only a few tiles are ever held in memory.
+    Missing tiles stay black.
+    """
+    window = get_pixel_window(min_lat, max_lat, min_lon, max_lon, zoom)
+    width = window[2] - window[0]
+    height = window[3] - window[1]
+    print(f"Stitching {width} x {height} raster into {raster_path}")
+
+    raster = open_raster(raster_path, width, height)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for x, y, tile_box, offset in tiles_in_window(window):
+            tile_path = cache.get(base_url, zoom, x, y)
+            if tile_path:
+                futures.append(executor.submit(_paste_tile, raster, tile_path, tile_box, offset))
+
+        for future in futures:
+            future.result()
+
+    cache.flush()
+    raster.flush()
+    return raster
+
+
+def save_raster(raster, output_path, quality=95, strip_rows=STRIP_ROWS, overviews=0):
+    """
+    Encode a memory-mapped raster (or the path of one) as PNG or JPEG without loading it whole.
+
+    PNGs are deflated strip by strip. For JPEGs the raster is mapped into PIL
+    without a copy and the encoder pulls rows from the memory map as it goes.
+    With overviews=N, N levels of 2x-downsampled PNG overviews are written next to
+    the output (see esa_overview), reduced from the same strips.
+    """
+    if isinstance(raster, str):
+        raster = np.load(raster, mmap_mode="r")
+    height, width = raster.shape[:2]
+
+    pyramid = OverviewPyramid(output_path, width, height, overviews) if overviews else None
+
+    if output_path.lower().endswith((".jpg", ".jpeg")):
+        img = Image.frombuffer("RGBX", (width, height), raster, "raw", "RGBX", 0, 1)
+        img.save(output_path, quality=quality)
+        if pyramid:
+            for y in range(0, height, strip_rows):
+                pyramid.write(raster[y:y + strip_rows, :, :3])
+    else:
+        with PngStripWriter(output_path, width, height, "RGB") as writer:
+            for y in range(0, height, strip_rows):
+                strip = raster[y:y + strip_rows, :, :3]
+                writer.write(strip)
+                if pyramid:
+                    pyramid.write(strip)
+
+    if pyramid:
+        pyramid.close()
+        print(f"Saved {overviews} overviews of {output_path}")
+
+    print(f"Saved {width} x {height} image to {output_path}")
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Default size cap of the tile cache (bytes)
+CACHE_MAX_BYTES = 20 * 1024 ** 3
+
+
+class TileCache:
+    """
+    Persistent on-disk tile cache with a size cap and least-recently-used eviction.
+
+    Tiles are keyed by (source, zoom, x, y), where source is the tile server base URL.
+    A tile only gets an entry in the sqlite index after it was written completely
+    (temporary file + atomic rename), so anything in the index is a good tile and
+    a crashed or partial write is never picked up on the next run. Tiles the server
+    doesn't have are recorded too (empty path), so they aren't requested again.
+
+    Access times of cache hits are kept in memory and written in one transaction by
+    `flush` (or `close`). Tiles this instance has read or written are never evicted,
+    so a run's tiles stay on disk until it has stitched them: use one TileCache per run.
+    """
+
+    def __init__(self, cache_dir, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tiles (
+                source TEXT NOT NULL,
+                zoom INTEGER NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (source, zoom, x, y)
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS tiles_last_access ON tiles (last_access)")
+        self.db.commit()
+
+        # Running size of the cache, so the cap can be checked without scanning the index
+        self.total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+        # Access times not written to the index yet, by tile key
+        self.accessed = {}
+        # Tiles of the current run, kept out of eviction
+        self.in_use = set()
+        # Set once everything left in the index is in use, eviction can't free anything more
+        self.nothing_to_evict = False
+
+    def _tile_file(self, source, zoom, x, y):
+        source_dir = hashlib.sha1(source.encode()).hexdigest()[:12]
+        return os.path.join(self.cache_dir, source_dir, str(zoom), str(x), f"{y}.png")
+
+    def total_bytes(self):
+        with self.lock:
+            return self.total
+
+    def get(self, source, zoom, x, y):
+        """
+        Return the path of a cached tile and mark it as recently used.
+
+        Returns "" for a tile the server doesn't have and None on a cache miss.
+        """
+        key = (source, zoom, x, y)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT path, size FROM tiles WHERE source = ? AND zoom = ? AND x = ? AND y = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+
+            path, size = row
+            if path and (not os.path.isfile(path) or os.path.getsize(path) != size):
+                # Removed or truncated behind our back, forget it so it gets fetched again
+                self.db.execute("DELETE FROM tiles WHERE source = ? AND zoom = ? AND x = ? AND y = ?", key)
+                self.db.commit()
+                self.total -= size
+                self.accessed.pop(key, None)
+                return None
+
+            self.accessed[key] = time.time()
+            self.in_use.add(key)
+            return path
+
+    def put(self, source, zoom, x, y, data):
+        """
+        Atomically store a tile's bytes, evicting least recently used tiles above the size cap.
+
+        Pass data=None to record that the server has no tile there.
+        """
+        if data is None:
+            path, data = "", b""
+        else:
+            path = self._tile_file(source, zoom, x, y)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            tmp_path = f"{path}.{threading.get_ident()}.part"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+        key = (source, zoom, x, y)
+        with self.lock:
+            old = self.db.execute(
+                "SELECT size FROM tiles WHERE source = ? AND zoom = ? AND x = ? AND y = ?", key
+            ).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO tiles (source, zoom, x, y, path, size, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, zoom, x, y, path, len(data), time.time()),
+            )
+            self.db.commit()
+            self.total += len(data) - (old[0] if old else 0)
+            self.accessed.pop(key, None)
+            self.in_use.add(key)
+            if self.total > self.max_bytes and not self.nothing_to_evict:
+                self._evict()
+
+        return path
+
+    def _evict(self):
+        """Drop least recently used tiles until the cache is under its cap, skipping the tiles in use."""
+        evicted = []
+        for source, zoom, x, y, path, size in self.db.execute(
+            "SELECT source, zoom, x, y, path, size FROM tiles ORDER BY last_access"
+        ):
+            if self.total <= self.max_bytes:
+                break
+            key = (source, zoom, x, y)
+            if key in self.in_use:
+                continue
+            evicted.append(key)
+            self.total -= size
+            if path and os.path.isfile(path):
+                os.remove(path)
+
+        if self.total > self.max_bytes:
+            # Only tiles of this run are left, and every new tile is one of them
+            self.nothing_to_evict = True
+            print(f"Cache is over its cap, the tiles of this run alone take {self.total / 1024 ** 2:.0f} MiB")
+
+        self.db.executemany("DELETE FROM tiles WHERE source = ? AND zoom = ? AND x = ? AND y = ?", evicted)
+        self.db.commit()
+        if evicted:
+            print(f"Evicted {len(evicted)} tiles from the cache")
+
+    def flush(self):
+        """Write the access times of the cache hits since the last flush, in one transaction."""
+        with self.lock:
+            if not self.accessed:
+                return
+            self.db.executemany(
+                "UPDATE tiles SET last_access = ? WHERE source = ? AND zoom = ? AND x = ? AND y = ?",
+                [(accessed, *key) for key, accessed in self.accessed.items()],
+            )
+            self.db.commit()
+            self.accessed = {}
+
+    def close(self):
+        self.flush()
+        self.db.close()
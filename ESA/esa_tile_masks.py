@@ -0,0 +1,178 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from PIL import Image
+
+from esa_mask import COLOR_CODING, LABEL_MAP_NAME, RGB_TOLERANCE, classify_pixels
+from esa_overview import OverviewPyramid
+from esa_raster import PngStripWriter
+from esa_tiles import TILE_SIZE, WORKERS, create_session, fetch_tile, get_pixel_window, tiles_in_window
+
+# Tiles fetched / classified ahead of the row being written, per worker
+IN_FLIGHT_PER_WORKER = 4
+
+
+def _classify_tile(session, cache, base_url, zoom, x, y, tile_box, color_coding, tolerance):
+    """
+    Fetch a tile (unless cached), decode the part inside the window and classify it.
+
+    Returns a uint16 array with bit k set where the pixel matches the k-th class, so
+    overlapping classes end up in every mask they match, just like `classify_overlay`.
+    """
+    failed = False
+    tile_path = cache.get(base_url, zoom, x, y)
+    if tile_path is None:
+        failed = fetch_tile(session, cache, base_url, zoom, x, y) is None
+        tile_path = cache.get(base_url, zoom, x, y)
+
+    if not tile_path:
+        # Missing tiles stay unclassified, like the black gaps of a stitched overlay
+        box_left, box_top, box_right, box_bottom = tile_box
+        return np.zeros((box_bottom - box_top, box_right - box_left), dtype=np.uint16), failed
+
+    with Image.open(tile_path) as tile:
+        pixels = np.asarray(tile.crop(tile_box).convert("RGB"))
+    matches = classify_pixels(pixels, color_coding, tolerance)
+    return (matches << np.arange(len(color_coding), dtype=np.uint16)).sum(axis=-1, dtype=np.uint16), failed
+
+
+class _MaskOutputs:
+    """The per-class masks and/or label map of an area, written top to bottom one band at a time."""
+
+    def __init__(self, output_folder, width, height, color_coding, masks, label_map, overviews):
+        self.num_classes = len(color_coding)
+        self.writers = []
+
+        if masks:
+            for bit, land_type in enumerate(color_coding):
+                self._add(f"{output_folder}/{land_type}.png", width, height, "L", None, overviews, bit)
+        if label_map:
+            palette = [[0, 0, 0]] + list(color_coding.values())
+            self._add(f"{output_folder}/{LABEL_MAP_NAME}", width, height, "P", palette, overviews, None)
+
+    def _add(self, path, width, height, mode, palette, overviews, bit):
+        self.writers.append((PngStripWriter(path, width, height, mode, palette=palette), bit))
+        if overviews:
+            self.writers.append((OverviewPyramid(path, width, height, overviews, mode, palette, categorical=True), bit))
+
+    def _labels(self, class_bits):
+        # Same ids as classify_labels: the first matching class wins
+        labels = np.zeros(class_bits.shape, dtype=np.uint8)
+        for bit in reversed(range(self.num_classes)):
+            labels[(class_bits >> bit) & 1 == 1] = bit + 1
+        return labels
+
+    def write(self, class_bits):
+        labels = None
+        for writer, bit in self.writers:
+            if bit is not None:
+                writer.write(((class_bits >> bit) & 1).astype(np.uint8) * 255)
+                continue
+            if labels is None:
+                labels = self._labels(class_bits)
+            writer.write(labels)
+
+    def close(self):
+        for writer, _ in self.writers:
+            writer.close()
+
+
+def fetch_masks_for_area(
+    min_lat,
+    max_lat,
+    min_lon,
+    max_lon,
+    zoom,
+    base_url,
+    cache,
+    output_folder,
+    color_coding=COLOR_CODING,
+    tolerance=RGB_TOLERANCE,
+    masks=True,
+    label_map=False,
+    overviews=0,
+    workers=WORKERS,
+):
+    """
+    Fetch, classify and write the land-cover masks of a bbox in one streaming pass.
+
+    Every tile is fetched (or taken from the TileCache), decoded, cropped to the bbox
+    and classified on a worker thread as soon as it is submitted, so network, decoding
+    and classification all overlap. Class matches land in the band of their tile row and
+    each finished band is appended to every `<land_type>.png` mask (and, with
+    label_map=True, the palette label map) straight away. Neither the stitched RGB
+    overlay nor a full-size mask is ever held in memory or written to disk.
+    Returns the list of (x, y) tiles that could not be fetched.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    window = get_pixel_window(min_lat, max_lat, min_lon, max_lon, zoom)
+    left, top, right, bottom = window
+    width, height = right - left, bottom - top
+
+    # Row-major order so the top bands complete first and can be written out
+    tiles = sorted(tiles_in_window(window), key=lambda tile: (tile[1], tile[0]))
+    tiles_per_row = (right - 1) // TILE_SIZE - left // TILE_SIZE + 1
+    print(f"Fetching and classifying {len(tiles)} tiles into {width} x {height} masks")
+
+    outputs = _MaskOutputs(output_folder, width, height, color_coding, masks, label_map, overviews)
+    session = create_session(workers)
+
+    # Band of class bits per tile row, with the number of tiles still missing from it
+    bands = {}
+    next_band = top // TILE_SIZE
+    failed = []
+    done = 0
+    start = time.perf_counter()
+
+    def place(future):
+        nonlocal next_band, done
+        x, y, tile_box, offset = futures.pop(future)
+        class_bits, tile_failed = future.result()
+        if tile_failed:
+            failed.append((x, y))
+
+        if y not in bands:
+            bands[y] = [np.zeros((tile_box[3] - tile_box[1], width), dtype=np.uint16), tiles_per_row]
+        band = bands[y]
+        band[0][:, offset[0]:offset[0] + class_bits.shape[1]] = class_bits
+        band[1] -= 1
+
+        # Write every band that is complete and next in line
+        while next_band in bands and bands[next_band][1] == 0:
+            outputs.write(bands.pop(next_band)[0])
+            next_band += 1
+
+        done += 1
+        if done % 100 == 0 or done == len(tiles):
+            print(f"Classified {done}/{len(tiles)} tiles ({done / (time.perf_counter() - start):.1f} tiles/s)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for x, y, tile_box, offset in tiles:
+                future = executor.submit(_classify_tile, session, cache, base_url, zoom, x, y, tile_box, color_coding, tolerance)
+                futures[future] = (x, y, tile_box, offset)
+
+                # Keep only a few tiles per worker in flight so at most a couple of bands are held
+                while len(futures) >= IN_FLIGHT_PER_WORKER * workers:
+                    finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        place(future)
+
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    place(future)
+
+        outputs.close()
+    finally:
+        session.close()
+        cache.flush()
+
+    print(f"Saved masks of {width} x {height} area to {output_folder}")
+    if failed:
+        print(f"Failed to fetch {len(failed)} tiles: {failed}")
+    return failed
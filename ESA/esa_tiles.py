@@ -0,0 +1,181 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+TILE_SIZE = 256
+
+# Fetch settings
+WORKERS = 16  # Tiles downloaded in parallel
+RETRIES = 3  # Extra attempts for a tile after a failed request
+BACKOFF = 0.5  # Seconds, doubled after every failed attempt
+TIMEOUT = 30  # Seconds per request
+
+
+def lat_lon_to_tile(lat, lon, zoom):
+    lat_rad = math.radians(lat)
+    n = 2.0 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
+    return x, y
+
+
+def get_tile_range(min_lat, max_lat, min_lon, max_lon, zoom):
+    min_x, min_y = lat_lon_to_tile(min_lat, min_lon, zoom)
+    max_x, max_y = lat_lon_to_tile(max_lat, max_lon, zoom)
+    return (min_x, max_x), (max_y, min_y)  # Ensure the Y range is in the correct order
+
+
+def lat_lon_to_pixel(lat, lon, zoom):
+    """Global Web Mercator pixel coordinates (fractional) of a lat/lon at the given zoom."""
+    lat_rad = math.radians(lat)
+    n = 2.0 ** zoom * TILE_SIZE
+    px = (lon + 180.0) / 360.0 * n
+    py = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n
+    return px, py
+
+
+def get_pixel_window(min_lat, max_lat, min_lon, max_lon, zoom):
+    """Return the (left, top, right, bottom) global pixel window covering the bbox at the given zoom."""
+    left, top = lat_lon_to_pixel(max_lat, min_lon, zoom)
+    right, bottom = lat_lon_to_pixel(min_lat, max_lon, zoom)
+    return math.floor(left), math.floor(top), math.ceil(right), math.ceil(bottom)
+
+
+def tiles_in_window(window):
+    """
+    Yield (x, y, tile_box, offset) for every tile overlapping a pixel window.
+
+    tile_box is the part of the tile inside the window, in tile pixels, and
+    offset is where that part goes in a raster covering just the window.
+    """
+    left, top, right, bottom = window
+    for x in range(left // TILE_SIZE, (right - 1) // TILE_SIZE + 1):
+        for y in range(top // TILE_SIZE, (bottom - 1) // TILE_SIZE + 1):
+            tile_left, tile_top = x * TILE_SIZE, y * TILE_SIZE
+            box_left = max(left, tile_left) - tile_left
+            box_top = max(top, tile_top) - tile_top
+            box_right = min(right, tile_left + TILE_SIZE) - tile_left
+            box_bottom = min(bottom, tile_top + TILE_SIZE) - tile_top
+            offset = (tile_left + box_left - left, tile_top + box_top - top)
+            yield x, y, (box_left, box_top, box_right, box_bottom), offset
+
+
+def create_session(workers=WORKERS):
+    """Session whose connection pool keeps one keep-alive connection per worker."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def tile_url(base_url, zoom, x, y):
+    return f"{base_url}/{zoom}/{x}/{y}.png"
+
+
+def fetch_tile(session, cache, base_url, zoom, x, y, retries=RETRIES, backoff=BACKOFF):
+    """
+    Download a single tile into the cache, retrying with exponential backoff on errors.
+
+    Returns the number of bytes downloaded (0 if the server has no tile there),
+    or None when every attempt failed.
+    """
+    url = tile_url(base_url, zoom, x, y)
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, timeout=TIMEOUT)
+
+            if response.status_code == 404:
+                print(f"No tile at {url}")
+                cache.put(base_url, zoom, x, y, None)
+                return 0
+
+            if response.status_code == 200:
+                # Make sure the body is a complete image before it lands in the cache
+                with Image.open(BytesIO(response.content)) as img:
+                    img.load()
+
+                cache.put(base_url, zoom, x, y, response.content)
+                return len(response.content)
+
+            print(f"Failed to fetch {url}. Status code: {response.status_code}")
+        except Exception as e:
+            print(f"Error fetching tile {url}: {e}")
+
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+
+    return None
+
+
+def fetch_tiles_for_area(min_lat, max_lat, min_lon, max_lon, zoom, base_url, cache, batch_size=10, workers=WORKERS,
+                         retries=RETRIES, backoff=BACKOFF, progress=None):
+    """
+    Download every tile overlapping the bbox that isn't in the TileCache yet.
+
+    Uses a pool of `workers` threads sharing one keep-alive session, and prints
+    progress and throughput every `batch_size` tiles. `progress`, if given, is
+    called with (done, total) after every tile.
+    Returns (failed, missing): the (x, y) tiles that could not be fetched and the
+    ones the server has no tile for (404). Missing tiles are recorded in the cache,
+    so they aren't requested again.
+    """
+    window = get_pixel_window(min_lat, max_lat, min_lon, max_lon, zoom)
+    tiles = [(x, y) for x, y, _, _ in tiles_in_window(window)]
+
+    # Tiles already in the cache need no network work at all
+    cached = len(tiles)
+    tiles = [(x, y) for x, y in tiles if cache.get(base_url, zoom, x, y) is None]
+    cached -= len(tiles)
+    print(f"{cached} tiles already cached")
+    cache.flush()
+    if not tiles:
+        return [], []
+
+    print(f"Fetching {len(tiles)} tiles at zoom {zoom} with {workers} workers")
+
+    session = create_session(workers)
+    failed = []
+    missing = []
+    done = 0
+    downloaded_bytes = 0
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(fetch_tile, session, cache, base_url, zoom, x, y, retries, backoff): (x, y)
+            for x, y in tiles
+        }
+
+        for future in as_completed(futures):
+            size = future.result()
+            done += 1
+            if size is None:
+                failed.append(futures[future])
+            elif size == 0:
+                missing.append(futures[future])
+            else:
+                downloaded_bytes += size
+
+            if progress is not None:
+                progress(done, len(tiles))
+            if done % batch_size == 0 or done == len(tiles):
+                elapsed = time.perf_counter() - start
+                print(
+                    f"Processed {done}/{len(tiles)} tiles "
+                    f"({done / elapsed:.1f} tiles/s, {downloaded_bytes / elapsed / 1024:.0f} KiB/s)"
+                )
+
+    session.close()
+
+    if missing:
+        print(f"No tiles on the server for {len(missing)} tiles")
+    if failed:
+        print(f"Failed to fetch {len(failed)} tiles: {failed}")
+    return failed, missing
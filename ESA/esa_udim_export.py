@@ -0,0 +1,97 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from esa_mask import COLOR_CODING, RGB_TOLERANCE, classify_overlay
+from esa_raster import raster_size, read_strips
+from udim_grid import GRID_SEGMENTS, get_quadrant_and_udim
+
+# The UDIM grid is the world grid rotated 90° CCW, so the texture of each tile
+# shows its world cell turned 90° CW
+UDIM_ROTATION = Image.ROTATE_270
+
+# Output names, matching what the Masks scripts load
+DIFFUSE_NAME = "Q{quadrant}_Diffuse_{udim}.jpg"
+MASK_NAME = "{land_type}_{quadrant}_{udim}.png"
+
+ENCODE_WORKERS = 8
+
+
+def _save_tile(pixels, path, resolution, resample):
+    img = Image.fromarray(pixels).transpose(UDIM_ROTATION)
+    if resolution:
+        img = img.resize((resolution, resolution), resample)
+    if path.endswith(".jpg"):
+        img.save(path, quality=95)
+    else:
+        img.save(path)
+
+
+def export_udim_textures(
+    overlay_path,
+    output_dir,
+    resolution=1024,
+    masks=True,
+    color_coding=COLOR_CODING,
+    tolerance=RGB_TOLERANCE,
+    workers=ENCODE_WORKERS,
+):
+    """
+    Cut the stitched overlay straight into per-quadrant, per-UDIM textures (1001..1078).
+
+    The overlay is read once, one band of 16 grid cells at a time. Every cell is written
+    as a `Q<quadrant>_Diffuse_<udim>.jpg` texture and, with masks=True, classified and
+    written as one `<land_type>_<quadrant>_<udim>.png` mask per class. A band's tiles are
+    encoded on a thread pool while the next band is read.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    width, height = raster_size(overlay_path)
+    col_edges = [round(i * width / GRID_SEGMENTS) for i in range(GRID_SEGMENTS + 1)]
+    row_edges = [round(r * height / GRID_SEGMENTS) for r in range(GRID_SEGMENTS + 1)]
+
+    band = []
+    band_index = 0
+    pending = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for y, strip in read_strips(overlay_path):
+            band.append(strip)
+
+            # A band may complete more than once per strip if bands are thinner than a strip
+            while band_index < GRID_SEGMENTS and y + len(strip) >= row_edges[band_index + 1]:
+                rows = np.concatenate(band)
+                band_top = y + len(strip) - len(rows)
+                cut = rows[row_edges[band_index] - band_top:row_edges[band_index + 1] - band_top]
+                band = [rows[row_edges[band_index + 1] - band_top:]]
+
+                # Image rows run north to south, grid rows south to north
+                j = GRID_SEGMENTS - 1 - band_index
+                futures = []
+                class_masks = classify_overlay(cut, color_coding, tolerance) if masks else {}
+
+                for i in range(GRID_SEGMENTS):
+                    quadrant, udim = get_quadrant_and_udim(i, j)
+                    left, right = col_edges[i], col_edges[i + 1]
+
+                    path = os.path.join(output_dir, DIFFUSE_NAME.format(quadrant=quadrant, udim=udim))
+                    futures.append(executor.submit(_save_tile, cut[:, left:right], path, resolution, Image.BILINEAR))
+
+                    for land_type, mask in class_masks.items():
+                        path = os.path.join(output_dir, MASK_NAME.format(land_type=land_type, quadrant=quadrant, udim=udim))
+                        futures.append(executor.submit(_save_tile, mask[:, left:right], path, resolution, Image.NEAREST))
+
+                # Wait for the previous band so at most two bands are held in memory
+                for future in pending:
+                    future.result()
+                pending = futures
+
+                print(f"Exported UDIM row {band_index + 1}/{GRID_SEGMENTS}")
+                band_index += 1
+
+        for future in pending:
+            future.result()
+
+    print(f"UDIM textures saved to {output_dir}")
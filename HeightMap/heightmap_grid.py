@@ -0,0 +1,185 @@
+import numpy as np
+from PIL import Image
+from scipy.interpolate import griddata
+
+from heightmap_stats import HeightStatistics
+
+
+# Function to normalize values to a specified range
+def normalize(values, norm_range=None):
+    if norm_range is None:
+        min_val = np.min(values)
+        max_val = np.max(values)
+    else:
+        min_val = norm_range['from'] if norm_range['from'] is not None else np.min(values)
+        max_val = norm_range['to'] if norm_range['to'] is not None else np.max(values)
+    return (values - min_val) / (max_val - min_val)
+
+
+# Max distance from a grid line, in grid steps, for a vertex to count as on it
+GRID_TOLERANCE = 0.01
+
+
+def _grid_axis(coords, tolerance=GRID_TOLERANCE):
+    """Return (index of every coordinate, number of grid lines) if coords sit on evenly spaced lines, else None."""
+    low, high = np.min(coords), np.max(coords)
+    if high == low:
+        return None
+
+    # Count the distinct lines, merging coordinates that differ only by float noise
+    count = len(np.unique(np.rint((coords - low) / (high - low) * 2 ** 20)))
+    if count < 2:
+        return None
+
+    position = (coords - low) / ((high - low) / (count - 1))
+    index = np.rint(position)
+    if np.max(np.abs(position - index)) > tolerance:
+        return None
+    return index.astype(np.int64), count
+
+
+def regular_grid_heights(vertices, tolerance=GRID_TOLERANCE):
+    """
+    Reshape the heights of a regular-grid terrain into a (ny, nx) array, rows going up in Y.
+
+    Returns None when the XY positions are not an evenly spaced, fully filled grid.
+    """
+    x_axis = _grid_axis(vertices[:, 0], tolerance)
+    y_axis = _grid_axis(vertices[:, 1], tolerance)
+    if x_axis is None or y_axis is None:
+        return None
+    (ix, nx), (iy, ny) = x_axis, y_axis
+
+    # Every grid point needs a vertex, duplicates (e.g. along seams) are fine
+    cell = iy * nx + ix
+    if np.count_nonzero(np.bincount(cell, minlength=nx * ny)) != nx * ny:
+        return None
+
+    heights = np.empty(nx * ny, dtype=np.float64)
+    heights[cell] = vertices[:, 2]
+    return heights.reshape(ny, nx)
+
+
+def _linear_weights(size, position):
+    """Source indices and weights that sample `size` grid lines at fractional positions (clamped to the grid)."""
+    position = np.clip(position, 0, size - 1)
+    low = np.minimum(position.astype(np.int64), size - 2)
+    return low, position - low
+
+
+def resample_bilinear(heights, resolution_x, resolution_y):
+    """Separable bilinear resampling of a (ny, nx) height array to resolution_y x resolution_x, corners aligned."""
+    return sample_bilinear(heights, np.linspace(0, heights.shape[1] - 1, resolution_x), np.linspace(0, heights.shape[0] - 1, resolution_y))
+
+
+def sample_bilinear(heights, x_position, y_position):
+    """
+    Heights at every (x, y) of the given fractional column and row positions, as a (len(y), len(x)) grid.
+
+    Positions are in grid lines of `heights` and clamped to it. Separable: columns
+    are interpolated for all rows first, then rows.
+    """
+    x0, fx = _linear_weights(heights.shape[1], x_position)
+    rows = heights[:, x0] * (1 - fx) + heights[:, x0 + 1] * fx
+
+    y0, fy = _linear_weights(heights.shape[0], y_position)
+    return rows[y0] * (1 - fy)[:, None] + rows[y0 + 1] * fy[:, None]
+
+
+def sample_points(heights, x_position, y_position, nodata=np.nan):
+    """
+    Heights at any number of points given by fractional column and row positions (broadcast together).
+
+    Bilinear inside the grid, nodata for points outside it.
+    """
+    x, y = np.broadcast_arrays(np.asarray(x_position, dtype=np.float64), np.asarray(y_position, dtype=np.float64))
+    rows, cols = heights.shape
+    inside = (x >= 0) & (x <= cols - 1) & (y >= 0) & (y <= rows - 1)
+
+    x0, fx = _linear_weights(cols, x)
+    y0, fy = _linear_weights(rows, y)
+    low = heights[y0, x0] * (1 - fx) + heights[y0, x0 + 1] * fx
+    high = heights[y0 + 1, x0] * (1 - fx) + heights[y0 + 1, x0 + 1] * fx
+    return np.where(inside, low * (1 - fy) + high * fy, nodata)
+
+
+def interpolate_height_grid(vertices, resolution_x, resolution_y, method="auto"):
+    """
+    Interpolate (N, 3) vertex coordinates onto a resolution_y x resolution_x grid of heights.
+
+    With method="auto", terrains whose vertices form a regular XY grid (like Blosm's)
+    are reshaped straight into a height array and resampled bilinearly, and only
+    irregular meshes are triangulated with griddata. method="linear" always uses griddata.
+    """
+    # Create a grid of the desired resolution
+    x_samples = np.linspace(np.min(vertices[:, 0]), np.max(vertices[:, 0]), resolution_x)
+    y_samples = np.linspace(np.min(vertices[:, 1]), np.max(vertices[:, 1]), resolution_y)
+    return interpolate_height_samples(vertices, x_samples, y_samples, method)
+
+
+def interpolate_height_samples(vertices, x_samples, y_samples, method="auto", verbose=True):
+    """
+    Interpolate (N, 3) vertex coordinates at every (x, y) of the given X and Y sample coordinates.
+
+    Returns a (len(y_samples), len(x_samples)) grid, see `interpolate_height_grid` for
+    the methods. Samples outside a regular grid take the height of its nearest edge.
+    """
+    x_coords, y_coords, z_coords = vertices[:, 0], vertices[:, 1], vertices[:, 2]
+
+    if method == "auto":
+        heights = regular_grid_heights(vertices)
+        if heights is not None:
+            if verbose:
+                print(f"Regular {heights.shape[1]} x {heights.shape[0]} vertex grid, resampling bilinearly")
+            x_low, x_high = np.min(x_coords), np.max(x_coords)
+            y_low, y_high = np.min(y_coords), np.max(y_coords)
+            return sample_bilinear(
+                heights,
+                (x_samples - x_low) / (x_high - x_low) * (heights.shape[1] - 1),
+                (y_samples - y_low) / (y_high - y_low) * (heights.shape[0] - 1),
+            )
+        if verbose:
+            print("Irregular vertex layout, falling back to griddata")
+    elif method != "linear":
+        raise ValueError("Unknown interpolation method.")
+
+    grid_x, grid_y = np.meshgrid(x_samples, y_samples)
+
+    # Interpolate vertex data onto the grid
+    grid_z = griddata((x_coords, y_coords), z_coords, (grid_x, grid_y), method='linear')
+
+    # Replace NaN values with the minimum value in the grid
+    return np.nan_to_num(grid_z, nan=np.min(z_coords))
+
+
+def normalize_height_grid(grid_z, normalization_method="regular", norm_range=None):
+    """
+    Scale a height grid to 0..1 with the "regular" (min/max), "smart" (clipped at 10 std devs)
+    or "percentile" (clipped at the 0.1 and 99.9 percentiles) method.
+
+    The statistics are gathered a band of rows at a time, see HeightStatistics.
+    """
+    if normalization_method == "regular":
+        return normalize(grid_z, norm_range)
+    elif normalization_method in ("smart", "percentile"):
+        return normalize(grid_z, HeightStatistics.from_array(grid_z).norm_range(normalization_method, norm_range))
+    else:
+        raise ValueError("Unknown normalization method.")
+
+
+def save_height_map(normalized_grid, filepath, rotation=None):
+    """Save a 0..1 height grid as a 16-bit grayscale PNG, with the first grid row at the bottom (then rotated, if given)."""
+    # Note: For 8-bit image export -> Scale to 0-255 -> Convert to uint8 -> Mode "L" for 8-bit grayscale
+    # Scale to 0-65535 for image export
+    image_data = (normalized_grid * 65535).astype(np.uint16)
+
+    # Create and save a single-channel grayscale image using PIL
+    img = Image.fromarray(image_data, mode="I;16")  # "I;16" mode for 16-bit grayscale
+
+    # Flip the image along the x-axis (to correct for the mesh-to-image mapping)
+    img = img.transpose(Image.FLIP_TOP_BOTTOM)
+    if rotation is not None:
+        img = img.transpose(rotation)
+
+    # Save the height map image
+    img.save(filepath)
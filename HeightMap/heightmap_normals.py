@@ -0,0 +1,145 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from heightmap_tiles import HEIGHT_MAP_NAME, UDIM_ROTATION, WORKERS, get_quadrant_and_udim, x_segments, x_step, y_segments, y_step
+
+# Tangent-space normal maps of the terrain straight from the per-UDIM height tiles,
+# in place of baking a NORMAL pass through Cycles (see Bake/bake_process.py).
+#
+#   python heightmap_normals.py height_tiles/ normals/ --heights 3012.5 5860.1
+
+# Same names the Masks scripts load (`{normal_prefix}_{udim}.jpg`)
+NORMAL_MAP_NAME = "Q{quadrant}_Normal_{udim}.jpg"
+
+# Blender's default JPEG quality
+JPEG_QUALITY = 90
+
+
+def load_height_tile(tiles_dir, i, j, min_height, max_height):
+    """Heights in metres of tile (i, j) north up, or None if it was not written."""
+    quadrant, udim = get_quadrant_and_udim(i, j)
+    path = os.path.join(tiles_dir, HEIGHT_MAP_NAME.format(quadrant=quadrant, udim=udim))
+    if not os.path.exists(path):
+        return None
+    with Image.open(path) as img:
+        # Undo the UDIM rotation
+        normalized = np.asarray(img.transpose(Image.ROTATE_90), dtype=np.float64) / 65535
+    return min_height + normalized * (max_height - min_height)
+
+
+def padded_tile(tiles_dir, i, j, min_height, max_height):
+    """
+    Tile (i, j) with a one pixel border taken from its eight neighbours.
+
+    Neighbouring tiles share their edge samples, so the border is the row or column
+    next to the shared one. Sides without a neighbour repeat the row or column
+    inside them, so tiles along the terrain's edge still agree on their seams.
+    """
+    tile = load_height_tile(tiles_dir, i, j, min_height, max_height)
+    if tile is None:
+        return None
+    padded = np.pad(tile, 1, mode="edge")
+
+    # Where a neighbour's pixels go in the padded tile and which of its pixels they are,
+    # per step west/east (di) and south/north (dj), rows going south
+    columns = {-1: (slice(0, 1), slice(-2, -1)), 0: (slice(1, -1), slice(None)), 1: (slice(-1, None), slice(1, 2))}
+    rows = {1: (slice(0, 1), slice(-2, -1)), 0: (slice(1, -1), slice(None)), -1: (slice(-1, None), slice(1, 2))}
+    found = set()
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            if (di, dj) == (0, 0) or not (0 <= i + di < x_segments and 0 <= j + dj < y_segments):
+                continue
+            neighbour = load_height_tile(tiles_dir, i + di, j + dj, min_height, max_height)
+            if neighbour is not None:
+                padded[rows[dj][0], columns[di][0]] = neighbour[rows[dj][1], columns[di][1]]
+                found.add((di, dj))
+
+    if (0, 1) not in found:
+        padded[0] = padded[1]
+    if (0, -1) not in found:
+        padded[-1] = padded[-2]
+    if (-1, 0) not in found:
+        padded[:, 0] = padded[:, 1]
+    if (1, 0) not in found:
+        padded[:, -1] = padded[:, -2]
+    return padded
+
+
+def tangent_normals(padded, pixel_x, pixel_y):
+    """
+    Unit normals of a height grid (with a one pixel border) from Sobel gradients, as (rows, cols, 3).
+
+    Components are in terrain tangent space: x along U, y along V and z up. The UDIM
+    textures are turned by UDIM_ROTATION, so U runs north and V west on the terrain.
+    """
+    p = padded
+    # Sobel derivatives per metre, east (+x) and north (rows go south)
+    dz_east = ((p[:-2, 2:] + 2 * p[1:-1, 2:] + p[2:, 2:]) - (p[:-2, :-2] + 2 * p[1:-1, :-2] + p[2:, :-2])) / (8 * pixel_x)
+    dz_north = ((p[:-2, :-2] + 2 * p[:-2, 1:-1] + p[:-2, 2:]) - (p[2:, :-2] + 2 * p[2:, 1:-1] + p[2:, 2:])) / (8 * pixel_y)
+
+    # World normal (-dz/dx, -dz/dy, 1) in (U = north, V = west, up)
+    normals = np.stack([-dz_north, dz_east, np.ones_like(dz_east)], axis=-1)
+    return normals / np.linalg.norm(normals, axis=-1, keepdims=True)
+
+
+def save_normal_map(normals, filepath, rotation=UDIM_ROTATION):
+    """Save unit normals as an 8-bit RGB (OpenGL, +Y green) normal map, rotated like the UDIM textures."""
+    rgb = np.rint((normals * 0.5 + 0.5) * 255).astype(np.uint8)
+    img = Image.fromarray(rgb, mode="RGB")
+    if rotation is not None:
+        img = img.transpose(rotation)
+    img.save(filepath, quality=JPEG_QUALITY)
+
+
+def write_normal_map(tiles_dir, output_dir, i, j, min_height, max_height):
+    padded = padded_tile(tiles_dir, i, j, min_height, max_height)
+    if padded is None:
+        return None
+
+    resolution = padded.shape[0] - 2
+    normals = tangent_normals(padded, x_step / (resolution - 1), y_step / (resolution - 1))
+
+    quadrant, udim = get_quadrant_and_udim(i, j)
+    filepath = os.path.join(output_dir, NORMAL_MAP_NAME.format(quadrant=quadrant, udim=udim))
+    save_normal_map(normals, filepath)
+    return filepath
+
+
+def generate_normal_maps(tiles_dir, output_dir, min_height, max_height, workers=WORKERS):
+    """
+    Write a `Q{quadrant}_Normal_{udim}.jpg` tangent-space normal map for every height tile.
+
+    min_height and max_height are the heights of 0 and 65535 in the tiles (the shared
+    normalization range), which sets the world scale of the slopes. Edge pixels see
+    the neighbouring tiles, so the normals match across UDIM seams.
+    Tiles written with keep_halo are not supported.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(write_normal_map, tiles_dir, output_dir, i, j, min_height, max_height)
+            for j in range(y_segments)
+            for i in range(x_segments)
+        ]
+        saved = [path for path in (future.result() for future in futures) if path]
+
+    print(f"Saved {len(saved)} normal maps to {output_dir} in {time.perf_counter() - start:.1f}s")
+    return saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Turn per-UDIM 16-bit height maps into tangent-space normal maps.")
+    parser.add_argument("tiles_dir", help="Folder of {quadrant}_{udim}.png height tiles from heightmap_tiles.py")
+    parser.add_argument("output_dir")
+    parser.add_argument("--heights", type=float, nargs=2, required=True, metavar=("MIN", "MAX"), help="Heights of 0 and 65535 in metres")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    generate_normal_maps(args.tiles_dir, args.output_dir, *args.heights, workers=args.workers)
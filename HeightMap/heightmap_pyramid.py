@@ -0,0 +1,290 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from heightmap_grid import sample_bilinear
+from heightmap_tiles import WORKERS, load_tile_mosaic
+
+# XYZ (Web Mercator) pyramid of height tiles over a lat/lon bbox, so clients read only
+# the tiles and zoom they need instead of re-running generate_height_map per size.
+#
+#   python heightmap_pyramid.py vertex_height_map.png height_pyramid/ --bbox 34.07201 34.21606 77.45396 77.62802 --heights 3012.5 5860.1
+
+TILE_SIZE = 256
+
+TILE_NAME = os.path.join("{zoom}", "{x}", "{y}.png")
+
+# 16-bit grayscale over the height range, or Mapbox Terrain-RGB (-10000 m + 0.1 m steps)
+ENCODINGS = ("gray16", "terrain-rgb")
+
+
+def lon_to_x(lon, zoom):
+    """Global Web Mercator pixel X (fractional) of longitudes."""
+    return (np.asarray(lon) + 180.0) / 360.0 * 2 ** zoom * TILE_SIZE
+
+
+def lat_to_y(lat, zoom):
+    """Global Web Mercator pixel Y (fractional) of latitudes."""
+    lat = np.radians(lat)
+    return (1.0 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2.0 * 2 ** zoom * TILE_SIZE
+
+
+def y_to_lat(y, zoom):
+    n = math.pi - 2.0 * math.pi * np.asarray(y) / (2 ** zoom * TILE_SIZE)
+    return np.degrees(np.arctan(np.sinh(n)))
+
+
+def x_to_lon(x, zoom):
+    return np.asarray(x) / (2 ** zoom * TILE_SIZE) * 360.0 - 180.0
+
+
+def tile_pixel_coordinates(zoom, x, y):
+    """Longitudes of the pixel columns and latitudes of the pixel rows (centres) of an XYZ tile."""
+    centres = np.arange(TILE_SIZE) + 0.5
+    return x_to_lon(x * TILE_SIZE + centres, zoom), y_to_lat(y * TILE_SIZE + centres, zoom)
+
+
+def pyramid_tile_range(zoom, min_lat, max_lat, min_lon, max_lon):
+    """((min_x, max_x), (min_y, max_y)) of the XYZ tiles covering the bbox at a zoom level."""
+    last = 2 ** zoom - 1
+    min_x = min(int(lon_to_x(min_lon, zoom) // TILE_SIZE), last)
+    max_x = min(int(lon_to_x(max_lon, zoom) // TILE_SIZE), last)
+    min_y = min(int(lat_to_y(max_lat, zoom) // TILE_SIZE), last)
+    max_y = min(int(lat_to_y(min_lat, zoom) // TILE_SIZE), last)
+    return (min_x, max_x), (min_y, max_y)
+
+
+def auto_max_zoom(width, min_lon, max_lon):
+    """Lowest zoom whose pixels are at least as fine as the height map's (along longitude)."""
+    pixel_degrees = (max_lon - min_lon) / (width - 1)
+    return max(0, math.ceil(math.log2(360.0 / (TILE_SIZE * pixel_degrees))))
+
+
+def tile_valid(zoom, x, y, bbox):
+    """(TILE_SIZE, TILE_SIZE) mask of the tile pixels whose centres fall inside the bbox."""
+    min_lat, max_lat, min_lon, max_lon = bbox
+    lon, lat = tile_pixel_coordinates(zoom, x, y)
+    return ((lat >= min_lat) & (lat <= max_lat))[:, None] & ((lon >= min_lon) & (lon <= max_lon))[None, :]
+
+
+def tile_path(output_dir, zoom, x, y, scheme="xyz"):
+    if scheme == "tms":
+        y = 2 ** zoom - 1 - y
+    return os.path.join(output_dir, TILE_NAME.format(zoom=zoom, x=x, y=y))
+
+
+def encode_heights(heights, encoding, height_range):
+    """Heights in metres to a PNG-ready PIL image in the given encoding."""
+    if encoding == "gray16":
+        low, high = height_range
+        normalized = np.clip((heights - low) / (high - low), 0, 1)
+        return Image.fromarray(np.rint(normalized * 65535).astype(np.uint16), mode="I;16")
+    elif encoding == "terrain-rgb":
+        value = np.clip(np.rint((heights + 10000.0) * 10.0), 0, 2 ** 24 - 1).astype(np.uint32)
+        rgb = np.stack([value >> 16, (value >> 8) & 255, value & 255], axis=-1).astype(np.uint8)
+        return Image.fromarray(rgb, mode="RGB")
+    else:
+        raise ValueError("Unknown height tile encoding.")
+
+
+def decode_heights(path, encoding, height_range):
+    """Heights in metres of a tile written by encode_heights."""
+    with Image.open(path) as img:
+        data = np.asarray(img, dtype=np.float64)
+    if encoding == "gray16":
+        low, high = height_range
+        return low + data / 65535 * (high - low)
+    return -10000.0 + (data[..., 0] * 65536 + data[..., 1] * 256 + data[..., 2]) * 0.1
+
+
+def save_mosaic(height_map, mosaic_path):
+    """
+    Save a height map (a 16-bit PNG, or the folder of `{quadrant}_{udim}.png` tiles) north up as a uint16 .npy.
+
+    Workers memory-map it and read only the rows and columns under their tile.
+    Returns its (height, width).
+    """
+    if not os.path.isdir(height_map):
+        with Image.open(height_map) as img:
+            mosaic = np.asarray(img, dtype=np.uint16)
+    else:
+        mosaic = load_tile_mosaic(height_map)
+
+    np.save(mosaic_path, mosaic)
+    return mosaic.shape
+
+
+def render_tile(mosaic_path, zoom, x, y, bbox, height_range, encoding, output_dir, scheme):
+    """Sample one tile of the finest level from the memory-mapped height map. Returns its path, or None if empty."""
+    valid = tile_valid(zoom, x, y, bbox)
+    if not valid.any():
+        return None
+
+    min_lat, max_lat, min_lon, max_lon = bbox
+    mosaic = np.load(mosaic_path, mmap_mode="r")
+    rows, cols = mosaic.shape
+    lon, lat = tile_pixel_coordinates(zoom, x, y)
+    col = (lon - min_lon) / (max_lon - min_lon) * (cols - 1)
+    row = (max_lat - lat) / (max_lat - min_lat) * (rows - 1)
+
+    # Read just the window under the tile
+    left = int(np.clip(np.floor(col.min()), 0, cols - 2))
+    right = int(np.clip(np.ceil(col.max()), left + 1, cols - 1))
+    top = int(np.clip(np.floor(row.min()), 0, rows - 2))
+    bottom = int(np.clip(np.ceil(row.max()), top + 1, rows - 1))
+    window = np.asarray(mosaic[top:bottom + 1, left:right + 1], dtype=np.float64)
+
+    normalized = sample_bilinear(window, col - left, row - top) / 65535
+    low, high = height_range
+    heights = np.where(valid, low + normalized * (high - low), low)
+
+    path = tile_path(output_dir, zoom, x, y, scheme)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    encode_heights(heights, encoding, height_range).save(path)
+    return path
+
+
+def reduce_tile(zoom, x, y, bbox, height_range, encoding, output_dir, scheme):
+    """
+    Build a tile from its four children one level down, averaging their pixels inside the bbox.
+
+    Returns its path, or None if none of the children were written.
+    """
+    total = np.zeros((TILE_SIZE, TILE_SIZE))
+    count = np.zeros((TILE_SIZE, TILE_SIZE))
+    half = TILE_SIZE // 2
+
+    for dx in (0, 1):
+        for dy in (0, 1):
+            child_x, child_y = 2 * x + dx, 2 * y + dy
+            path = tile_path(output_dir, zoom + 1, child_x, child_y, scheme)
+            if not os.path.exists(path):
+                continue
+            heights = decode_heights(path, encoding, height_range)
+            valid = tile_valid(zoom + 1, child_x, child_y, bbox).astype(np.float64)
+
+            # 2x2 sums of the valid child pixels go into this child's quarter
+            block = (slice(dy * half, (dy + 1) * half), slice(dx * half, (dx + 1) * half))
+            weighted = heights * valid
+            total[block] = weighted[0::2, 0::2] + weighted[0::2, 1::2] + weighted[1::2, 0::2] + weighted[1::2, 1::2]
+            count[block] = valid[0::2, 0::2] + valid[0::2, 1::2] + valid[1::2, 0::2] + valid[1::2, 1::2]
+
+    if not count.any():
+        return None
+
+    heights = np.where(count > 0, total / np.maximum(count, 1), height_range[0])
+    path = tile_path(output_dir, zoom, x, y, scheme)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    encode_heights(heights, encoding, height_range).save(path)
+    return path
+
+
+def build_height_pyramid(
+    height_map,
+    output_dir,
+    min_height,
+    max_height,
+    min_lat,
+    max_lat,
+    min_lon,
+    max_lon,
+    min_zoom=0,
+    max_zoom=None,
+    encoding="gray16",
+    scheme="xyz",
+    workers=WORKERS,
+):
+    """
+    Write an XYZ (or TMS) pyramid of 256 px height tiles over a bbox, plus a tiles.json describing it.
+
+    height_map is a 16-bit height map covering the bbox (0..65535 = min_height..max_height),
+    or the folder of per-UDIM tiles from heightmap_tiles. Only the finest level is
+    sampled from it; every level above is reduced 2x2 from the level below, so the
+    levels agree with each other. Tiles of a level are written in parallel and tiles
+    with no pixel inside the bbox are skipped.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError("Unknown height tile encoding.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    bbox = (min_lat, max_lat, min_lon, max_lon)
+    height_range = (min_height, max_height)
+
+    mosaic_path = os.path.join(output_dir, "mosaic.npy")
+    _, width = save_mosaic(height_map, mosaic_path)
+    if max_zoom is None:
+        max_zoom = auto_max_zoom(width, min_lon, max_lon)
+
+    available = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            (min_x, max_x), (min_y, max_y) = pyramid_tile_range(zoom, *bbox)
+            tiles = [(x, y) for y in range(min_y, max_y + 1) for x in range(min_x, max_x + 1)]
+
+            if zoom == max_zoom:
+                futures = [
+                    executor.submit(render_tile, mosaic_path, zoom, x, y, bbox, height_range, encoding, output_dir, scheme)
+                    for x, y in tiles
+                ]
+            else:
+                futures = [
+                    executor.submit(reduce_tile, zoom, x, y, bbox, height_range, encoding, output_dir, scheme)
+                    for x, y in tiles
+                ]
+            # The next level up reads these tiles, so the whole level has to be written first
+            written = sum(future.result() is not None for future in futures)
+            available[zoom] = written
+            print(f"Level {zoom}: {written} tiles ({len(tiles) - written} empty)")
+
+    os.remove(mosaic_path)
+
+    tilejson = {
+        "tilejson": "2.1.0",
+        "name": os.path.basename(os.path.abspath(output_dir)),
+        "format": "png",
+        "encoding": encoding,
+        "scheme": scheme,
+        "tiles": ["{z}/{x}/{y}.png"],
+        "bounds": [min_lon, min_lat, max_lon, max_lat],
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+        "heights": [min_height, max_height],
+    }
+    with open(os.path.join(output_dir, "tiles.json"), "w") as f:
+        json.dump(tilejson, f, indent=2)
+
+    print(f"Saved {sum(available.values())} height tiles to {output_dir} in {time.perf_counter() - start:.1f}s")
+    return available
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an XYZ pyramid of 16-bit or Terrain-RGB height tiles over a bbox.")
+    parser.add_argument("height_map", help="16-bit height map PNG, or the folder of {quadrant}_{udim}.png tiles")
+    parser.add_argument("output_dir")
+    parser.add_argument("--bbox", type=float, nargs=4, required=True, metavar=("MIN_LAT", "MAX_LAT", "MIN_LON", "MAX_LON"))
+    parser.add_argument("--heights", type=float, nargs=2, required=True, metavar=("MIN", "MAX"), help="Heights of 0 and 65535 in metres")
+    parser.add_argument("--min-zoom", type=int, default=0)
+    parser.add_argument("--max-zoom", type=int)
+    parser.add_argument("--encoding", default="gray16", choices=ENCODINGS)
+    parser.add_argument("--scheme", default="xyz", choices=["xyz", "tms"])
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    build_height_pyramid(
+        args.height_map,
+        args.output_dir,
+        *args.heights,
+        *args.bbox,
+        min_zoom=args.min_zoom,
+        max_zoom=args.max_zoom,
+        encoding=args.encoding,
+        scheme=args.scheme,
+        workers=args.workers,
+    )
@@ -0,0 +1,190 @@
+import json
+import math
+
+import numpy as np
+
+# Histogram size, whatever the height range: bins double in width as the range grows
+HISTOGRAM_BINS = 4096
+
+# Finest bin width in metres (a power of two, so histograms of different tiles can always be merged)
+MIN_BIN_WIDTH = 2.0 ** -10
+
+# Standard deviations the "smart" normalization keeps around the mean
+NUM_STD_DEVIATIONS = 10
+
+# Percentiles the "percentile" normalization clips at
+CLIP_PERCENTILES = (0.1, 99.9)
+
+# Percentiles reported in the statistics file
+REPORT_PERCENTILES = (0.1, 1, 5, 25, 50, 75, 95, 99, 99.9)
+
+# Rows added to the statistics at a time when scanning a whole grid
+CHUNK_ROWS = 256
+
+
+class HeightStatistics:
+    """
+    Streaming statistics of heights: count, mean, variance, min, max and a histogram for percentiles.
+
+    Feed it any number of arrays with `update`, or combine the statistics of separate
+    tiles with `merge`, and memory stays at HISTOGRAM_BINS counters. Bin edges sit on
+    multiples of a power-of-two width anchored at 0, and the width doubles whenever
+    the heights seen no longer fit, so percentiles are accurate to one bin width.
+    """
+
+    def __init__(self, bins=HISTOGRAM_BINS, min_width=MIN_BIN_WIDTH):
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.width = min_width
+        self.start = None  # Index of the first bin, in bin widths from 0
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @classmethod
+    def from_array(cls, heights, chunk_rows=CHUNK_ROWS, **kwargs):
+        """Statistics of a height grid, scanned a band of rows at a time."""
+        stats = cls(**kwargs)
+        heights = np.asarray(heights)
+        for row in range(0, heights.shape[0], chunk_rows):
+            stats.update(heights[row:row + chunk_rows])
+        return stats
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def _coarsen(self):
+        """Double the bin width, adding up pairs of bins."""
+        bins = len(self.counts)
+        start = self.start // 2
+        index = (self.start + np.arange(bins)) // 2 - start
+        self.counts = np.bincount(index, weights=self.counts, minlength=bins).astype(np.int64)
+        self.start = start
+        self.width *= 2
+
+    def _cover(self, low, high):
+        """Make the bins span low..high as well as every height seen so far."""
+        low, high = min(low, self.min), max(high, self.max)
+        bins = len(self.counts)
+        if self.start is None:
+            self.start = math.floor(low / self.width)
+        while math.floor(high / self.width) - math.floor(low / self.width) >= bins:
+            self._coarsen()
+
+        # Slide the window down to the new lowest height, the top bins dropped are empty
+        start = math.floor(low / self.width)
+        shift = self.start - start
+        if shift > 0:
+            self.counts = np.concatenate([np.zeros(shift, dtype=np.int64), self.counts[:bins - shift]])
+            self.start = start
+
+    def _add_moments(self, count, mean, m2, low, high):
+        # Chan et al.'s parallel update of the mean and sum of squared deviations
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def update(self, heights):
+        """Add an array of heights (NaNs are skipped)."""
+        values = np.asarray(heights, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return self
+
+        low, high = float(values.min()), float(values.max())
+        self._cover(low, high)
+        index = np.clip(np.floor(values / self.width).astype(np.int64) - self.start, 0, len(self.counts) - 1)
+        self.counts += np.bincount(index, minlength=len(self.counts))
+
+        mean = float(values.mean())
+        self._add_moments(len(values), mean, float(np.sum((values - mean) ** 2)), low, high)
+        return self
+
+    def merge(self, other):
+        """Add the statistics of another set of heights, e.g. a tile computed by another worker."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.counts, self.width, self.start = other.counts.copy(), other.width, other.start
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return self
+
+        other_counts, other_width, other_start = other.counts, other.width, other.start
+        while self.width < other_width:
+            self._coarsen()
+        self._cover(other.min, other.max)
+
+        # Bring the other histogram to this bin width
+        while other_width < self.width:
+            start = other_start // 2
+            index = (other_start + np.arange(len(other_counts))) // 2 - start
+            other_counts = np.bincount(index, weights=other_counts, minlength=len(other_counts)).astype(np.int64)
+            other_start, other_width = start, other_width * 2
+
+        # All of the other's heights fall inside this window
+        offset = other_start - self.start
+        used = np.flatnonzero(other_counts)
+        self.counts[used + offset] += other_counts[used]
+
+        self._add_moments(other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    def percentile(self, q):
+        """Height below which q percent of the heights lie, interpolated inside its bin."""
+        if self.count == 0:
+            raise ValueError("No heights to take a percentile of.")
+        target = q / 100 * self.count
+        cumulative = np.cumsum(self.counts)
+        k = min(int(np.searchsorted(cumulative, target)), len(self.counts) - 1)
+        below = cumulative[k - 1] if k > 0 else 0
+        fraction = (target - below) / self.counts[k] if self.counts[k] else 0.0
+        return float(np.clip((self.start + k + fraction) * self.width, self.min, self.max))
+
+    def norm_range(self, normalization_method="regular", norm_range=None, percentiles=CLIP_PERCENTILES):
+        """
+        Normalization bounds for these heights, shared by every tile they came from.
+
+        "regular" takes the min and max, "smart" the mean plus or minus
+        NUM_STD_DEVIATIONS standard deviations (within min and max) and "percentile"
+        the given low and high percentiles. Bounds set in norm_range win.
+        """
+        if normalization_method == "regular":
+            low, high = self.min, self.max
+        elif normalization_method == "smart":
+            low = max(self.mean - NUM_STD_DEVIATIONS * self.std, self.min)
+            high = min(self.mean + NUM_STD_DEVIATIONS * self.std, self.max)
+        elif normalization_method == "percentile":
+            low, high = self.percentile(percentiles[0]), self.percentile(percentiles[1])
+        else:
+            raise ValueError("Unknown normalization method.")
+
+        if norm_range is not None:
+            low = norm_range['from'] if norm_range['from'] is not None else low
+            high = norm_range['to'] if norm_range['to'] is not None else high
+        return {'from': float(low), 'to': float(high)}
+
+    def summary(self, percentiles=REPORT_PERCENTILES):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min,
+            "max": self.max,
+            "bin_width": self.width,
+            "percentiles": {str(q): self.percentile(q) for q in percentiles},
+        }
+
+    def save(self, path, norm_range=None):
+        """Write the summary (and the normalization range the tiles used) as JSON for the tools reading the tiles."""
+        summary = self.summary()
+        if norm_range is not None:
+            summary["norm_range"] = norm_range
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
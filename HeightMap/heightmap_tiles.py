@@ -0,0 +1,234 @@
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from heightmap_grid import interpolate_height_samples, normalize, save_height_map
+from heightmap_stats import HeightStatistics
+from udim_grid import GRID_SEGMENTS, get_quadrant_and_udim
+
+# Terrain grid, the same one SliceNDice and the Rename scripts cut the terrain with
+x_min = -7999.99951171875
+x_max = 8000.0
+y_min = -8000.00048828125
+y_max = 8000.0
+
+x_segments = GRID_SEGMENTS
+y_segments = GRID_SEGMENTS
+
+x_step = (x_max - x_min) / x_segments  # 1000.0 units per segment
+y_step = (y_max - y_min) / y_segments  # 1000.0 units per segment
+
+# Extra pixels rasterized around every tile so neighbouring tiles agree on their shared edges
+HALO = 1
+
+# Tile images are turned like the UDIM textures (see ESA/esa_udim_export.py)
+UDIM_ROTATION = Image.ROTATE_270
+
+HEIGHT_MAP_NAME = "{quadrant}_{udim}.png"
+
+# Statistics of all tile heights and the normalization range they share
+STATS_NAME = "height_stats.json"
+
+WORKERS = os.cpu_count() or 4
+
+
+def cell_index(coords, start, step, segments):
+    return np.clip(((coords - start) // step).astype(np.int64), 0, segments - 1)
+
+
+def sort_vertices_by_cell(vertices, sorted_path):
+    """
+    Save the vertices grouped by grid cell to a .npy file and return where each cell starts.
+
+    Cell (i, j) holds rows starts[j * x_segments + i] to starts[j * x_segments + i + 1],
+    so a tile worker can memory-map the file and read only the cells it needs.
+    """
+    cells = cell_index(vertices[:, 1], y_min, y_step, y_segments) * x_segments + cell_index(vertices[:, 0], x_min, x_step, x_segments)
+    order = np.argsort(cells, kind="stable")
+    np.save(sorted_path, np.ascontiguousarray(vertices[order], dtype=np.float32))
+    return np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=x_segments * y_segments))])
+
+
+def _tile_vertices(vertices, starts, i, j, x_margin, y_margin):
+    """Vertices of cell (i, j) and those of its neighbours within the margin around it."""
+    parts = []
+    for nj in range(max(j - 1, 0), min(j + 2, y_segments)):
+        for ni in range(max(i - 1, 0), min(i + 2, x_segments)):
+            cell = nj * x_segments + ni
+            parts.append(np.asarray(vertices[starts[cell]:starts[cell + 1]]))
+    tile = np.concatenate(parts)
+
+    left, bottom = x_min + i * x_step, y_min + j * y_step
+    inside = (
+        (tile[:, 0] >= left - x_margin) & (tile[:, 0] <= left + x_step + x_margin)
+        & (tile[:, 1] >= bottom - y_margin) & (tile[:, 1] <= bottom + y_step + y_margin)
+    )
+    return tile[inside]
+
+
+def rasterize_tile(sorted_path, starts, i, j, resolution, raw_dir, margin, keep_halo=False, method="auto"):
+    """
+    Rasterize one grid cell into a float32 height grid in raw_dir and return its HeightStatistics.
+
+    The tile's samples run from edge to edge of the cell, so neighbouring tiles share
+    their edge samples exactly. One extra pixel is rasterized on every side from the
+    neighbouring cells' vertices, so the edge samples are interpolated from the same
+    vertices on both sides; it is cropped off unless keep_halo is set.
+    """
+    vertices = np.load(sorted_path, mmap_mode="r")
+    pixel_x = x_step / (resolution - 1)
+    pixel_y = y_step / (resolution - 1)
+    tile = _tile_vertices(vertices, starts, i, j, margin + HALO * pixel_x, margin + HALO * pixel_y)
+    if len(tile) < 3:
+        return None
+
+    # Sample positions from global pixel indices, so shared edges get bit-identical coordinates
+    x_samples = x_min + (i * (resolution - 1) + np.arange(-HALO, resolution + HALO)) * pixel_x
+    y_samples = y_min + (j * (resolution - 1) + np.arange(-HALO, resolution + HALO)) * pixel_y
+
+    grid_z = interpolate_height_samples(tile, x_samples, y_samples, method, verbose=False)
+    if not keep_halo:
+        grid_z = grid_z[HALO:-HALO, HALO:-HALO]
+
+    np.save(os.path.join(raw_dir, f"{i}_{j}.npy"), grid_z.astype(np.float32))
+    return HeightStatistics.from_array(grid_z)
+
+
+def save_tile(raw_dir, i, j, norm_range, output_dir):
+    """Quantize a raw tile from rasterize_tile into its `{quadrant}_{udim}.png` 16-bit height map."""
+    raw_path = os.path.join(raw_dir, f"{i}_{j}.npy")
+    grid_z = np.load(raw_path)
+    quadrant, udim = get_quadrant_and_udim(i, j)
+    filepath = os.path.join(output_dir, HEIGHT_MAP_NAME.format(quadrant=quadrant, udim=udim))
+    save_height_map(np.clip(normalize(grid_z, norm_range), 0, 1), filepath, UDIM_ROTATION)
+    os.remove(raw_path)
+    return filepath
+
+
+def mosaic_tile(mosaic, i, j):
+    """The (rows, cols) window of tile (i, j) in a north-up mosaic of all tiles, its shared edges included."""
+    step = (mosaic.shape[0] - 1) // y_segments
+    top = (y_segments - 1 - j) * step
+    return mosaic[top:top + step + 1, i * step:i * step + step + 1]
+
+
+def load_tile_mosaic(tiles_dir):
+    """
+    Put the HEIGHT_MAP_NAME tiles of a folder back together into one north-up uint16 height map.
+
+    Neighbouring tiles share their edge samples, so they overlap by one pixel.
+    Tiles written with keep_halo are not supported.
+    """
+    mosaic = None
+    for j in range(y_segments):
+        for i in range(x_segments):
+            quadrant, udim = get_quadrant_and_udim(i, j)
+            # Undo the UDIM rotation to get the tile north up again
+            with Image.open(os.path.join(tiles_dir, HEIGHT_MAP_NAME.format(quadrant=quadrant, udim=udim))) as img:
+                tile = np.asarray(img.transpose(Image.ROTATE_90), dtype=np.uint16)
+
+            if mosaic is None:
+                step = tile.shape[0] - 1
+                mosaic = np.zeros((y_segments * step + 1, x_segments * step + 1), dtype=np.uint16)
+            mosaic_tile(mosaic, i, j)[:] = tile
+    return mosaic
+
+
+def vertex_spacing(vertices):
+    """Rough distance between neighbouring vertices, assuming they cover their bbox evenly."""
+    area = np.ptp(vertices[:, 0]) * np.ptp(vertices[:, 1])
+    return float(np.sqrt(area / max(len(vertices), 1)))
+
+
+def generate_tile_height_maps(
+    vertices_path,
+    output_dir,
+    resolution=1024,
+    normalization_method="regular",
+    norm_range=None,
+    keep_halo=False,
+    method="auto",
+    workers=WORKERS,
+):
+    """
+    Write one `{quadrant}_{udim}.png` height map per cell of the 16x16 terrain grid.
+
+    The vertices (an (N, 3) .npy file) are grouped by cell once, then every tile is
+    rasterized in a process pool from just its own and its neighbours' vertices, so
+    a worker's memory depends on the tile size, not on the whole terrain.
+
+    All tiles share one normalization range. Each worker returns the HeightStatistics
+    of its tile, which are merged into statistics of the whole terrain without ever
+    holding more than a tile; the range taken from them quantizes every tile and is
+    saved with the statistics in height_stats.json.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    vertices = np.load(vertices_path)
+    # Enough neighbouring vertices to interpolate right up to (and past) the tile edges
+    margin = 2 * vertex_spacing(vertices)
+
+    sorted_path = os.path.join(output_dir, "vertices_by_cell.npy")
+    starts = sort_vertices_by_cell(vertices, sorted_path)
+    del vertices
+
+    raw_dir = os.path.join(output_dir, "raw_tiles")
+    os.makedirs(raw_dir, exist_ok=True)
+    cells = [(i, j) for j in range(y_segments) for i in range(x_segments)]
+    print(f"Rasterizing {len(cells)} tiles at {resolution} x {resolution} with {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(rasterize_tile, sorted_path, starts, i, j, resolution, raw_dir, margin, keep_halo, method)
+            for i, j in cells
+        ]
+        stats = HeightStatistics()
+        rasterized = []
+        for cell, future in zip(cells, futures):
+            tile_stats = future.result()
+            if tile_stats is not None:
+                stats.merge(tile_stats)
+                rasterized.append(cell)
+        del futures
+
+        norm_range = stats.norm_range(normalization_method, norm_range)
+        stats.save(os.path.join(output_dir, STATS_NAME), norm_range)
+        print(f"Heights {stats.min:.2f} to {stats.max:.2f}, normalized over {norm_range['from']:.2f} to {norm_range['to']:.2f}")
+
+        futures = [executor.submit(save_tile, raw_dir, i, j, norm_range, output_dir) for i, j in rasterized]
+        saved = [future.result() for future in futures]
+
+    os.remove(sorted_path)
+    shutil.rmtree(raw_dir)
+
+    print(f"Saved {len(saved)} height map tiles to {output_dir} in {time.perf_counter() - start:.1f}s")
+    return saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rasterize terrain vertices into per-UDIM 16-bit height maps.")
+    parser.add_argument("vertices", help="(N, 3) float .npy file of terrain vertices")
+    parser.add_argument("output_dir")
+    parser.add_argument("--resolution", type=int, default=1024)
+    parser.add_argument("--normalization", default="regular", choices=["regular", "smart", "percentile"])
+    parser.add_argument("--norm-from", type=float, help="Fixed height mapped to 0")
+    parser.add_argument("--norm-to", type=float, help="Fixed height mapped to 65535")
+    parser.add_argument("--keep-halo", action="store_true", help="Keep the one pixel halo around every tile")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    generate_tile_height_maps(
+        args.vertices,
+        args.output_dir,
+        resolution=args.resolution,
+        normalization_method=args.normalization,
+        norm_range={"from": args.norm_from, "to": args.norm_to},
+        keep_halo=args.keep_halo,
+        workers=args.workers,
+    )
@@ -1,6 +1,7 @@
 import bpy, bmesh
 from bpy import context
 from mathutils import Vector
+import bisect
 import time
 
 building_name = 'Var_2 New house'
@@ -98,56 +99,89 @@ def find_intersecting_buildings(terrain_bbox_axes):
                 intersecting_buildings.append(obj)
     return intersecting_buildings
 
+def cell_range(low, high, planes):
+    """
+    First and last cell (between consecutive planes) that the span low..high overlaps, or None if it misses the grid.
+
+    Cells the span only touches at their edge plane are left out, they would get nothing but that plane.
+    """
+    if high <= planes[0] or low >= planes[-1]:
+        return None
+    first = max(bisect.bisect_right(planes, low) - 1, 0)
+    last = min(bisect.bisect_left(planes, high) - 1, len(planes) - 2)
+    return first, max(first, last)
+
+def cut(bm, plane_co, plane_no, clear_inner=False, clear_outer=False):
+    bmesh.ops.bisect_plane(
+        bm, geom=bm.verts[:]+bm.edges[:]+bm.faces[:],
+        plane_co=plane_co, plane_no=plane_no,
+        clear_inner=clear_inner, clear_outer=clear_outer
+    )
+
+def split_mesh(bm, plane_co, plane_no):
+    """Cut a bmesh in two at a plane: returns the part behind the plane (a copy) and the part in front (bm itself)."""
+    behind = bm.copy()
+    cut(behind, plane_co, plane_no, clear_outer=True)
+    cut(bm, plane_co, plane_no, clear_inner=True)
+    return behind, bm
+
+def slice_cells(bm, building, planes_x, planes_y, i0, i1, j0, j1, created_objects):
+    """
+    Recursively halve bm at the middle plane of cells i0..i1 x j0..j1 until every part is a single cell.
+
+    X is split down to single columns before Y, and the lower half always goes first,
+    so cells come out in the same i, then j order as a cell by cell loop and newobj
+    numbers them the same. Every level cuts the mesh once, so the total work is
+    about mesh size x log(cells) instead of mesh size x cells. Consumes bm.
+    """
+    if len(bm.verts) == 0:
+        bm.free()
+        return
+
+    if i0 < i1:
+        middle = (i0 + i1 + 1) // 2
+        behind, front = split_mesh(bm, (planes_x[middle], 0, 0), (1, 0, 0))
+        slice_cells(behind, building, planes_x, planes_y, i0, middle - 1, j0, j1, created_objects)
+        slice_cells(front, building, planes_x, planes_y, middle, i1, j0, j1, created_objects)
+    elif j0 < j1:
+        middle = (j0 + j1 + 1) // 2
+        behind, front = split_mesh(bm, (0, planes_y[middle], 0), (0, 1, 0))
+        slice_cells(behind, building, planes_x, planes_y, i0, i1, j0, middle - 1, created_objects)
+        slice_cells(front, building, planes_x, planes_y, i0, i1, middle, j1, created_objects)
+    else:
+        # Calculate tile's center
+        center_x = (planes_x[i0] + planes_x[i0 + 1]) / 2
+        center_y = (planes_y[j0] + planes_y[j0 + 1]) / 2
+        created_objects.append(newobj(bm, building, i0, j0, center_x, center_y))
+        bm.free()
+
 def slice_building(building, planes_x, planes_y):
-    bmo = bmesh.new()
-    bmo.from_mesh(building.data)
+    # Only the cells under the building's bounding box can get any of it
+    bb = list(bbox(building))
+    min_x, max_x = min(v.x for v in bb), max(v.x for v in bb)
+    min_y, max_y = min(v.y for v in bb), max(v.y for v in bb)
+    x_range = cell_range(min_x, max_x, planes_x)
+    y_range = cell_range(min_y, max_y, planes_y)
+    if x_range is None or y_range is None:
+        return []
+    (i0, i1), (j0, j1) = x_range, y_range
+
+    bm = bmesh.new()
+    bm.from_mesh(building.data)
     created_objects = []
 
-    # Create grid slices by combining X and Y planes
-    for i in range(len(planes_x)-1):  # X segments
-        for j in range(len(planes_y)-1):  # Y segments
-            # Get current cell boundaries
-            p0_x = planes_x[i]
-            p1_x = planes_x[i+1]
-            p0_y = planes_y[j]
-            p1_y = planes_y[j+1]
-
-            # Calculate tile's center
-            center_x = (p0_x + p1_x) / 2
-            center_y = (p0_y + p1_y) / 2
-
-            # Create working copy of the mesh
-            bm = bmo.copy()
-
-            # X-direction slicing
-            bmesh.ops.bisect_plane(
-                bm, geom=bm.verts[:]+bm.edges[:]+bm.faces[:],
-                plane_co=(p0_x, 0, 0), plane_no=(1, 0, 0), 
-                clear_inner=True
-            )
-            bmesh.ops.bisect_plane(
-                bm, geom=bm.verts[:]+bm.edges[:]+bm.faces[:],
-                plane_co=(p1_x, 0, 0), plane_no=(1, 0, 0), 
-                clear_outer=True
-            )
-
-            # Y-direction slicing
-            bmesh.ops.bisect_plane(
-                bm, geom=bm.verts[:]+bm.edges[:]+bm.faces[:],
-                plane_co=(0, p0_y, 0), plane_no=(0, 1, 0), 
-                clear_inner=True
-            )
-            bmesh.ops.bisect_plane(
-                bm, geom=bm.verts[:]+bm.edges[:]+bm.faces[:],
-                plane_co=(0, p1_y, 0), plane_no=(0, 1, 0), 
-                clear_outer=True
-            )
-
-            if len(bm.verts) > 0:
-                new_obj = newobj(bm, building, i, j, center_x, center_y)
-                # new_obj = newobj(bm, building, i, j)  # Pass i and j for UDIM
-                created_objects.append(new_obj)
-
+    # Clip whatever sticks out past the outer planes of the overlapped cells (only at the terrain's edge)
+    if min_x < planes_x[i0]:
+        cut(bm, (planes_x[i0], 0, 0), (1, 0, 0), clear_inner=True)
+    if max_x > planes_x[i1 + 1]:
+        cut(bm, (planes_x[i1 + 1], 0, 0), (1, 0, 0), clear_outer=True)
+    if min_y < planes_y[j0]:
+        cut(bm, (0, planes_y[j0], 0), (0, 1, 0), clear_inner=True)
+    if max_y > planes_y[j1 + 1]:
+        cut(bm, (0, planes_y[j1 + 1], 0), (0, 1, 0), clear_outer=True)
+
+    # A building inside one cell goes straight through, the rest is split cell range by cell range
+    slice_cells(bm, building, planes_x, planes_y, i0, i1, j0, j1, created_objects)
     return created_objects
 
 def slice_terrain_and_buildings():
@@ -0,0 +1,333 @@
+import argparse
+import gzip
+import json
+import math
+import os
+import struct
+
+import numpy as np
+from PIL import Image
+
+# Quantized-mesh-1.0 terrain tiles (https://github.com/CesiumGS/quantized-mesh) for Cesium,
+# cut from a height map over a lat/lon bbox. Runs headless, NumPy only.
+#
+# HeightMap/ has to be on PYTHONPATH (see README.md):
+#
+#   python quantized_mesh.py vertex_height_map.png terrain/ --bbox 34.07201 34.21606 77.45396 77.62802 --heights 3012.5 5860.1
+
+from heightmap_grid import sample_points
+from heightmap_tiles import load_tile_mosaic
+from rtin import Rtin, merge_seams
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_B = 6356752.314245179
+WGS84_E2 = 1 - (WGS84_B / WGS84_A) ** 2
+
+QUANTIZED_MAX = 32767
+
+# Vertices per tile side, as in cesium-terrain-builder
+GRID_SIZE = 65
+
+# Height given to the parts of a tile outside the height map
+NODATA_HEIGHT = 0.0
+
+
+class HeightGrid:
+    """
+    Terrain heights in metres over a lat/lon bbox, rows running north to south.
+
+    `sample` interpolates bilinearly at any lon/lat and returns nodata_height
+    outside the bbox.
+    """
+
+    def __init__(self, heights, min_lat, max_lat, min_lon, max_lon, nodata_height=NODATA_HEIGHT):
+        self.heights = heights
+        self.min_lat, self.max_lat = min_lat, max_lat
+        self.min_lon, self.max_lon = min_lon, max_lon
+        self.nodata_height = nodata_height
+
+    @classmethod
+    def from_png(cls, path, min_height, max_height, min_lat, max_lat, min_lon, max_lon, **kwargs):
+        """Read a 16-bit height map written by generate_height_map (0..65535 mapped to min_height..max_height)."""
+        with Image.open(path) as img:
+            normalized = np.asarray(img, dtype=np.float32) / 65535
+        return cls(min_height + normalized * (max_height - min_height), min_lat, max_lat, min_lon, max_lon, **kwargs)
+
+    @classmethod
+    def from_tiles(cls, tiles_dir, min_height, max_height, min_lat, max_lat, min_lon, max_lon, **kwargs):
+        """Read the folder of height tiles written by heightmap_tiles, put back together by load_tile_mosaic."""
+        mosaic = load_tile_mosaic(tiles_dir)
+        normalized = mosaic.astype(np.float32) / 65535
+        return cls(min_height + normalized * (max_height - min_height), min_lat, max_lat, min_lon, max_lon, **kwargs)
+
+    @property
+    def pixel_degrees(self):
+        return (self.max_lon - self.min_lon) / (self.heights.shape[1] - 1)
+
+    def sample(self, lon, lat):
+        """Heights at the (broadcast) lon/lat arrays."""
+        rows, cols = self.heights.shape
+        x = (np.asarray(lon) - self.min_lon) / (self.max_lon - self.min_lon) * (cols - 1)
+        y = (self.max_lat - np.asarray(lat)) / (self.max_lat - self.min_lat) * (rows - 1)
+        return sample_points(self.heights, x, y, self.nodata_height)
+
+
+def tile_bounds(zoom, x, y):
+    """(west, south, east, north) in degrees of a TMS tile of the geographic (EPSG:4326) tiling scheme."""
+    size = 180.0 / 2 ** zoom
+    return -180.0 + x * size, -90.0 + y * size, -180.0 + (x + 1) * size, -90.0 + (y + 1) * size
+
+
+def tile_range(zoom, min_lat, max_lat, min_lon, max_lon):
+    """((min_x, max_x), (min_y, max_y)) of the tiles covering the bbox at a zoom level."""
+    size = 180.0 / 2 ** zoom
+    x_count, y_count = 2 ** (zoom + 1), 2 ** zoom
+    min_x = min(int((min_lon + 180.0) // size), x_count - 1)
+    max_x = min(int((max_lon + 180.0) // size), x_count - 1)
+    min_y = min(int((min_lat + 90.0) // size), y_count - 1)
+    max_y = min(int((max_lat + 90.0) // size), y_count - 1)
+    return (min_x, max_x), (min_y, max_y)
+
+
+def auto_max_zoom(grid, grid_size=GRID_SIZE):
+    """Lowest zoom whose vertex spacing is at least as fine as the height map's pixels."""
+    return max(0, math.ceil(math.log2(180.0 / ((grid_size - 1) * grid.pixel_degrees))))
+
+
+def to_ecef(lon, lat, height):
+    """WGS84 geodetic degrees / metres to Earth-centred, Earth-fixed metres, as (..., 3)."""
+    lon, lat = np.radians(lon), np.radians(lat)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+    return np.stack([
+        (n + height) * np.cos(lat) * np.cos(lon),
+        (n + height) * np.cos(lat) * np.sin(lon),
+        (n * (1 - WGS84_E2) + height) * np.sin(lat),
+    ], axis=-1)
+
+
+def horizon_occlusion_point(positions, center):
+    """Cesium's EllipsoidalOccluder.computeHorizonCullingPoint for the tile's ECEF positions."""
+    radii = np.array([WGS84_A, WGS84_A, WGS84_B])
+    scaled = positions / radii
+    direction = center / radii
+    direction = direction / np.linalg.norm(direction)
+
+    magnitude_squared = np.maximum(np.sum(scaled ** 2, axis=1), 1.0)
+    magnitude = np.sqrt(magnitude_squared)
+    unit = scaled / magnitude[:, None]
+
+    cos_alpha = unit @ direction
+    sin_alpha = np.linalg.norm(np.cross(unit, direction), axis=1)
+    cos_beta = 1.0 / magnitude
+    sin_beta = np.sqrt(magnitude_squared - 1.0) * cos_beta
+    denominator = cos_alpha * cos_beta - sin_alpha * sin_beta
+    if np.any(denominator <= 0):
+        # Some point is beyond the horizon from every side, fall back to the center
+        return center
+    return direction * np.max(1.0 / denominator) * radii
+
+
+def zigzag_delta(values):
+    """Zig-zag encoded deltas of a uint16 array."""
+    delta = np.diff(values.astype(np.int32), prepend=0)
+    return ((delta << 1) ^ (delta >> 31)).astype(np.uint16)
+
+
+def high_water_mark(indices):
+    """High-water-mark encoding of an index buffer whose vertices are numbered in order of first use."""
+    previous_highest = np.concatenate([[0], np.maximum.accumulate(indices)[:-1] + 1])
+    return previous_highest - indices
+
+
+def order_by_first_use(triangles, vertex_count):
+    """Order of the vertices by first use in the triangles (unused ones last), and the new index of every old one."""
+    flat = triangles.ravel()
+    first_use = np.full(vertex_count, len(flat), dtype=np.int64)
+    np.minimum.at(first_use, flat, np.arange(len(flat)))
+    order = np.argsort(first_use, kind="stable")
+    renumber = np.empty(vertex_count, dtype=np.int64)
+    renumber[order] = np.arange(vertex_count)
+    return order, renumber
+
+
+def grid_mesh(grid_size=GRID_SIZE):
+    """u, v (0..32767) of a regular grid_size x grid_size vertex grid, rows going north, and its triangles."""
+    steps = np.rint(np.linspace(0, QUANTIZED_MAX, grid_size)).astype(np.int64)
+    v, u = np.meshgrid(steps, steps, indexing="ij")
+
+    index = np.arange(grid_size * grid_size).reshape(grid_size, grid_size)
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    # Counter-clockwise seen from above
+    triangles = np.concatenate([np.stack([a, b, d], axis=1), np.stack([a, d, c], axis=1)])
+    return u.ravel(), v.ravel(), triangles
+
+
+def encode_tile(u, v, heights, triangles, bounds):
+    """
+    Encode one quantized-mesh-1.0 tile.
+
+    u and v are 0..32767 positions in the tile (v going north), heights are in metres
+    and triangles index the vertices counter-clockwise.
+    """
+    west, south, east, north = bounds
+    min_height, max_height = float(np.min(heights)), float(np.max(heights))
+
+    order, renumber = order_by_first_use(triangles, len(u))
+    u, v, heights = u[order], v[order], heights[order]
+    triangles = renumber[triangles]
+
+    lon = west + u / QUANTIZED_MAX * (east - west)
+    lat = south + v / QUANTIZED_MAX * (north - south)
+    positions = to_ecef(lon, lat, heights)
+
+    center = to_ecef((west + east) / 2, (south + north) / 2, (min_height + max_height) / 2)
+    sphere_center = (positions.min(axis=0) + positions.max(axis=0)) / 2
+    sphere_radius = float(np.max(np.linalg.norm(positions - sphere_center, axis=1)))
+    occlusion = horizon_occlusion_point(positions, center)
+
+    height_range = max_height - min_height
+    h = np.zeros(len(u), dtype=np.int64) if height_range == 0 else np.rint((heights - min_height) / height_range * QUANTIZED_MAX).astype(np.int64)
+
+    data = bytearray(struct.pack("<3d2f4d3d", *center, min_height, max_height, *sphere_center, sphere_radius, *occlusion))
+    data += struct.pack("<I", len(u))
+    for values in (u, v, h):
+        data += zigzag_delta(values).tobytes()
+
+    # 32-bit indices (aligned to 4 bytes) once the vertices no longer fit 16 bits
+    index_type = np.uint32 if len(u) > 65536 else np.uint16
+    alignment = np.dtype(index_type).itemsize
+    data += bytes(-len(data) % alignment)
+
+    data += struct.pack("<I", len(triangles))
+    data += high_water_mark(triangles.ravel()).astype(index_type).tobytes()
+
+    # West, south, east and north edge vertices, each sorted along its edge
+    for on_edge, along in ((u == 0, v), (v == 0, u), (u == QUANTIZED_MAX, v), (v == QUANTIZED_MAX, u)):
+        edge = np.flatnonzero(on_edge)
+        edge = edge[np.argsort(along[edge], kind="stable")]
+        data += struct.pack("<I", len(edge)) + edge.astype(index_type).tobytes()
+
+    return bytes(data)
+
+
+def write_tile(output_dir, zoom, x, y, data, compress=False):
+    path = os.path.join(output_dir, str(zoom), str(x), f"{y}.terrain")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        # Served gzipped, the web server has to send Content-Encoding: gzip
+        f.write(gzip.compress(data) if compress else data)
+    return path
+
+
+def rtin_meshes(rtin, tile_heights, max_error):
+    """
+    RTIN meshes of the tiles of one level for max_error metres, as {(x, y): (vertex ids, triangles, error)}.
+
+    The error maps are merged across the level's tile edges first, so neighbouring
+    tiles keep the same edge vertices and meet without cracks.
+    """
+    error_maps = {key: rtin.errors(heights.reshape(rtin.grid_size, rtin.grid_size)) for key, heights in tile_heights.items()}
+    seams = [((x, y), (x + 1, y), "x") for x, y in error_maps if (x + 1, y) in error_maps]
+    # Grid rows go north, so the northern tile's first row is the southern tile's last
+    seams += [((x, y), (x, y + 1), "y") for x, y in error_maps if (x, y + 1) in error_maps]
+    merge_seams(rtin, error_maps, seams)
+
+    meshes = {}
+    for key, errors in error_maps.items():
+        vertices, triangles = rtin.mesh(errors, max_error)
+        error = rtin.mesh_error(tile_heights[key].reshape(rtin.grid_size, rtin.grid_size), vertices, triangles)
+        # RTIN winds clockwise in (column, row) order, which is clockwise seen from above with rows going north
+        meshes[key] = vertices[:, 1] * rtin.grid_size + vertices[:, 0], triangles[:, ::-1], error
+    return meshes
+
+
+def export_quantized_mesh(grid, output_dir, min_zoom=0, max_zoom=None, grid_size=GRID_SIZE, compress=False, max_error=None):
+    """
+    Write a quantized-mesh-1.0 TMS pyramid of the bbox of a HeightGrid, plus its layer.json.
+
+    Every tile overlapping the bbox gets a grid_size x grid_size vertex mesh, and both
+    level 0 tiles are always written since Cesium needs them to start. Levels run from
+    min_zoom to max_zoom (default: as fine as the height map's pixels).
+
+    With max_error (metres at max_zoom, doubling every level up), the grids are thinned
+    into RTIN meshes cut at that error instead (grid_size must be 2^k + 1).
+    """
+    if max_zoom is None:
+        max_zoom = auto_max_zoom(grid, grid_size)
+
+    u, v, triangles = grid_mesh(grid_size)
+    rtin = Rtin(grid_size) if max_error is not None else None
+    available = []
+    written = 0
+
+    for zoom in range(min_zoom, max_zoom + 1):
+        (min_x, max_x), (min_y, max_y) = tile_range(zoom, grid.min_lat, grid.max_lat, grid.min_lon, grid.max_lon)
+        ranges = [{"startX": min_x, "startY": min_y, "endX": max_x, "endY": max_y}]
+        tiles = [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+        if zoom == 0:
+            tiles = [(0, 0), (1, 0)]
+            ranges = [{"startX": 0, "startY": 0, "endX": 1, "endY": 0}]
+
+        tile_heights = {}
+        for x, y in tiles:
+            west, south, east, north = tile_bounds(zoom, x, y)
+            lon = west + u / QUANTIZED_MAX * (east - west)
+            lat = south + v / QUANTIZED_MAX * (north - south)
+            tile_heights[x, y] = grid.sample(lon, lat)
+
+        if rtin is None:
+            meshes = {key: (np.arange(len(u)), triangles, 0.0) for key in tiles}
+        else:
+            level_error = max_error * 2 ** (max_zoom - zoom)
+            meshes = rtin_meshes(rtin, tile_heights, level_error)
+
+        for x, y in tiles:
+            vertex_ids, tile_triangles, _ = meshes[x, y]
+            data = encode_tile(u[vertex_ids], v[vertex_ids], tile_heights[x, y][vertex_ids], tile_triangles, tile_bounds(zoom, x, y))
+            write_tile(output_dir, zoom, x, y, data, compress)
+            written += 1
+
+        available.append(ranges)
+        if rtin is None:
+            print(f"Level {zoom}: {len(tiles)} tiles")
+        else:
+            error = max(mesh[2] for mesh in meshes.values())
+            print(f"Level {zoom}: {len(tiles)} tiles, {sum(len(mesh[1]) for mesh in meshes.values())} triangles, max error {error:.2f} m (cut at {level_error:g} m)")
+
+    layer = {
+        "tilejson": "2.1.0",
+        "name": os.path.basename(os.path.abspath(output_dir)),
+        "format": "quantized-mesh-1.0",
+        "version": "1.0.0",
+        "scheme": "tms",
+        "tiles": ["{z}/{x}/{y}.terrain?v={version}"],
+        "projection": "EPSG:4326",
+        "bounds": [grid.min_lon, grid.min_lat, grid.max_lon, grid.max_lat],
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+        "available": available,
+    }
+    with open(os.path.join(output_dir, "layer.json"), "w") as f:
+        json.dump(layer, f, indent=2)
+
+    print(f"Saved {written} terrain tiles and layer.json to {output_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a height map as quantized-mesh-1.0 terrain tiles.")
+    parser.add_argument("height_map", help="16-bit height map PNG, or the folder of {quadrant}_{udim}.png tiles")
+    parser.add_argument("output_dir")
+    parser.add_argument("--bbox", type=float, nargs=4, required=True, metavar=("MIN_LAT", "MAX_LAT", "MIN_LON", "MAX_LON"))
+    parser.add_argument("--heights", type=float, nargs=2, required=True, metavar=("MIN", "MAX"), help="Heights of 0 and 65535 in metres")
+    parser.add_argument("--min-zoom", type=int, default=0)
+    parser.add_argument("--max-zoom", type=int)
+    parser.add_argument("--grid-size", type=int, default=GRID_SIZE)
+    parser.add_argument("--gzip", action="store_true", help="Gzip the tiles (serve with Content-Encoding: gzip)")
+    parser.add_argument("--max-error", type=float, help="Mesh the tiles with RTIN within this error (metres) at the max zoom")
+    args = parser.parse_args()
+
+    load = HeightGrid.from_tiles if os.path.isdir(args.height_map) else HeightGrid.from_png
+    height_grid = load(args.height_map, *args.heights, *args.bbox)
+    export_quantized_mesh(height_grid, args.output_dir, args.min_zoom, args.max_zoom, args.grid_size, args.gzip, args.max_error)
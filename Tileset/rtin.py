@@ -0,0 +1,338 @@
+import argparse
+import json
+import math
+import os
+import struct
+
+import numpy as np
+from PIL import Image
+
+# Right-triangulated irregular network (RTIN) meshing of height map tiles, after
+# Evans et al., "Right-Triangulated Irregular Networks" and mapbox/martini.
+# The error map of a tile is built once, then meshes for any max error are cut from it.
+# HeightMap/ has to be on PYTHONPATH (see README.md):
+#
+#   python rtin.py height_tiles/ terrain_lods/ --bbox 34.07201 34.21606 77.45396 77.62802 --heights 3012.5 5860.1 --errors 32 8 2
+
+from heightmap_grid import resample_bilinear
+from heightmap_tiles import load_tile_mosaic, mosaic_tile, x_min, x_segments, x_step, y_min, y_segments, y_step
+from udim_grid import get_quadrant_and_udim
+
+# Error thresholds (metres) the LOD meshes are cut at, coarse to fine
+LOD_ERRORS = (32.0, 8.0, 2.0)
+
+
+class Rtin:
+    """
+    RTIN hierarchy of a grid_size x grid_size height grid (grid_size must be 2^k + 1).
+
+    Triangles are split along their hypotenuse, level by level. Every level is kept
+    as arrays of (x, y) grid corners: a and b end the hypotenuse, c is the right angle.
+    """
+
+    def __init__(self, grid_size):
+        tile_size = grid_size - 1
+        if tile_size & (tile_size - 1) or tile_size < 2:
+            raise ValueError(f"RTIN grid size must be 2^k + 1, got {grid_size}")
+        self.grid_size = grid_size
+
+        # The two halves of the square, split along its diagonal
+        a = np.array([[tile_size, tile_size], [0, 0]])
+        b = np.array([[0, 0], [tile_size, tile_size]])
+        c = np.array([[0, tile_size], [tile_size, 0]])
+
+        self.levels = []
+        while True:
+            self.levels.append((a, b, c))
+            # Legs of one diagonal cell split into half cells, whose hypotenuse has no grid midpoint
+            if np.any((a[0] - c[0]) % 2):
+                break
+            a, b, c = self._children(a, b, c)
+
+    @staticmethod
+    def _children(a, b, c):
+        m = (a + b) // 2
+        return np.concatenate([c, b]), np.concatenate([a, c]), np.concatenate([m, m])
+
+    def _index(self, points):
+        return points[:, 1] * self.grid_size + points[:, 0]
+
+    def errors(self, heights):
+        """
+        Error map of a height grid: for every grid point, the largest height error
+        of leaving out it or any point that depends on it.
+        """
+        h = np.asarray(heights, dtype=np.float64).ravel()
+        errors = np.zeros(self.grid_size * self.grid_size)
+
+        for level, (a, b, c) in reversed(list(enumerate(self.levels))):
+            m = self._index((a + b) // 2)
+            middle_error = np.abs((h[self._index(a)] + h[self._index(b)]) / 2 - h[m])
+            np.maximum.at(errors, m, middle_error)
+            if level + 1 < len(self.levels):
+                np.maximum.at(errors, m, self._child_errors(errors, a, b, c))
+
+        return errors.reshape(self.grid_size, self.grid_size)
+
+    def _child_errors(self, errors, a, b, c):
+        return np.maximum(errors[self._index((a + c) // 2)], errors[self._index((b + c) // 2)])
+
+    def propagate(self, errors):
+        """Raise every point's error to at least that of the points depending on it, after edges were changed."""
+        flat = errors.ravel()
+        for a, b, c in reversed(self.levels[:-1]):
+            np.maximum.at(flat, self._index((a + b) // 2), self._child_errors(flat, a, b, c))
+        return errors
+
+    def mesh(self, errors, max_error):
+        """
+        Cut the mesh whose triangles all have a hypotenuse midpoint error within max_error.
+
+        Returns (vertices, triangles): (V, 2) int (x, y) grid positions and (T, 3) vertex
+        indices. Triangles wind clockwise in (x, y) grid space, which is counter-clockwise
+        with rows going south.
+        """
+        flat = errors.ravel()
+        a, b, c = self.levels[0]
+        kept = []
+
+        while len(a):
+            legs = np.abs(a - c).sum(axis=1) > 1
+            split = legs & (flat[self._index((a + b) // 2)] > max_error)
+            kept.append(np.stack([a[~split], b[~split], c[~split]], axis=1))
+            a, b, c = self._children(a[split], b[split], c[split])
+
+        corners = np.concatenate(kept).reshape(-1, 2)
+        used, triangles = np.unique(self._index(corners), return_inverse=True)
+        vertices = np.stack([used % self.grid_size, used // self.grid_size], axis=1)
+        return vertices, triangles.reshape(-1, 3)
+
+    @staticmethod
+    def mesh_error(heights, vertices, triangles):
+        """
+        Largest height difference between a mesh and the grid points it covers.
+
+        The error map bounds each left out point against its own triangle only, so
+        this measures the mesh itself, triangle size by triangle size.
+        """
+        corners = vertices[triangles]
+        z = heights[corners[..., 1], corners[..., 0]]
+        sizes = np.ptp(corners, axis=1).max(axis=1)
+        error = 0.0
+
+        for size in np.unique(sizes):
+            offsets = np.stack(np.meshgrid(np.arange(size + 1), np.arange(size + 1)), axis=-1).reshape(-1, 2)
+            selected = np.flatnonzero(sizes == size)
+            # Bound the (triangles x points) arrays
+            for chunk in np.array_split(selected, max(1, len(selected) * len(offsets) // 2 ** 22)):
+                p, tz = corners[chunk].astype(np.float64), z[chunk]
+                # Square boxes may run off the grid, those points are outside the triangle anyway
+                points = np.minimum(corners[chunk].min(axis=1)[:, None, :] + offsets, heights.shape[0] - 1)
+                (x0, y0), (x1, y1), (x2, y2) = (p[:, k].T[..., None] for k in range(3))
+                px, py = points[..., 0] - x2, points[..., 1] - y2
+
+                det = (y1 - y2) * (x0 - x2) + (x2 - x1) * (y0 - y2)
+                l0 = ((y1 - y2) * px + (x2 - x1) * py) / det
+                l1 = ((y2 - y0) * px + (x0 - x2) * py) / det
+                l2 = 1 - l0 - l1
+                inside = (l0 >= -1e-9) & (l1 >= -1e-9) & (l2 >= -1e-9)
+
+                interpolated = l0 * tz[:, 0, None] + l1 * tz[:, 1, None] + l2 * tz[:, 2, None]
+                difference = np.abs(interpolated - heights[points[..., 1], points[..., 0]])
+                error = max(error, float(np.max(difference, where=inside, initial=0.0)))
+
+        return error
+
+
+def merge_seams(rtin, error_maps, seams):
+    """
+    Make the error maps of neighbouring tiles agree along their shared edges, in place.
+
+    seams lists (key_a, key_b, axis) pairs: axis "x" when b is right of a (a's last
+    column is b's first), "y" when b is below a (a's last row is b's first). Edge
+    errors are raised to the larger of both sides and pushed up each hierarchy
+    until nothing changes, so both tiles keep the same edge vertices at any max
+    error and the meshes meet without cracks.
+    """
+    def edges(key_a, key_b, axis):
+        if axis == "x":
+            return error_maps[key_a][:, -1], error_maps[key_b][:, 0]
+        return error_maps[key_a][-1], error_maps[key_b][0]
+
+    changed = True
+    while changed:
+        changed = False
+        dirty = set()
+        for key_a, key_b, axis in seams:
+            edge_a, edge_b = edges(key_a, key_b, axis)
+            merged = np.maximum(edge_a, edge_b)
+            if np.any(merged != edge_a):
+                edge_a[:] = merged
+                dirty.add(key_a)
+            if np.any(merged != edge_b):
+                edge_b[:] = merged
+                dirty.add(key_b)
+
+        for key in dirty:
+            rtin.propagate(error_maps[key])
+            changed = True
+
+    return error_maps
+
+
+def fit_grid_size(heights):
+    """Resample a height tile to the nearest 2^k + 1 size at or above its own, as RTIN needs."""
+    size = max(heights.shape)
+    grid_size = 2 ** math.ceil(math.log2(size - 1)) + 1
+    if heights.shape == (grid_size, grid_size):
+        return heights
+    return resample_bilinear(heights, grid_size, grid_size)
+
+
+def write_glb(path, positions, triangles):
+    """Write a bare glTF 2.0 binary with one triangle mesh (float32 positions, uint32 indices)."""
+    positions = np.ascontiguousarray(positions, dtype=np.float32)
+    indices = np.ascontiguousarray(triangles, dtype=np.uint32).ravel()
+    position_bytes = positions.tobytes()
+    index_bytes = indices.tobytes()
+
+    gltf = {
+        "asset": {"version": "2.0"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0}],
+        "meshes": [{"primitives": [{"attributes": {"POSITION": 0}, "indices": 1}]}],
+        "buffers": [{"byteLength": len(position_bytes) + len(index_bytes)}],
+        "bufferViews": [
+            {"buffer": 0, "byteOffset": 0, "byteLength": len(position_bytes), "target": 34962},
+            {"buffer": 0, "byteOffset": len(position_bytes), "byteLength": len(index_bytes), "target": 34963},
+        ],
+        "accessors": [
+            {
+                "bufferView": 0, "componentType": 5126, "count": len(positions), "type": "VEC3",
+                "min": positions.min(axis=0).tolist(), "max": positions.max(axis=0).tolist(),
+            },
+            {"bufferView": 1, "componentType": 5125, "count": len(indices), "type": "SCALAR"},
+        ],
+    }
+
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode()
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    bin_chunk = position_bytes + index_bytes
+    bin_chunk += bytes(-len(bin_chunk) % 4)
+
+    with open(path, "wb") as f:
+        f.write(struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(json_chunk) + 8 + len(bin_chunk)))
+        f.write(struct.pack("<I4s", len(json_chunk), b"JSON") + json_chunk)
+        f.write(struct.pack("<I4s", len(bin_chunk), b"BIN\x00") + bin_chunk)
+
+
+def east_north_up(lat, lon):
+    """Column-major ENU-to-ECEF transform at a lat/lon on the WGS84 ellipsoid, as 3D Tiles wants it."""
+    a, e2 = 6378137.0, 6.69437999014e-3
+    lat, lon = math.radians(lat), math.radians(lon)
+    n = a / math.sqrt(1 - e2 * math.sin(lat) ** 2)
+    origin = [n * math.cos(lat) * math.cos(lon), n * math.cos(lat) * math.sin(lon), n * (1 - e2) * math.sin(lat)]
+    east = [-math.sin(lon), math.cos(lon), 0]
+    north = [-math.sin(lat) * math.cos(lon), -math.sin(lat) * math.sin(lon), math.cos(lat)]
+    up = [math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)]
+    return east + [0] + north + [0] + up + [0] + origin + [1]
+
+
+def load_height_tiles(tiles_dir, min_height, max_height):
+    """The height tiles of heightmap_tiles as north-up height grids in metres, keyed (i, j)."""
+    heights = min_height + load_tile_mosaic(tiles_dir) / 65535 * (max_height - min_height)
+    return {(i, j): fit_grid_size(mosaic_tile(heights, i, j)) for j in range(y_segments) for i in range(x_segments)}
+
+
+def export_lod_tileset(tiles_dir, output_dir, min_height, max_height, min_lat, max_lat, min_lon, max_lon, lod_errors=LOD_ERRORS):
+    """
+    Mesh every height tile with RTIN at each of lod_errors and write the LODs as GLBs and a tileset.json.
+
+    Each tile is a chain of LODs from coarse to fine (refine REPLACE), and every LOD's
+    geometricError is the error measured on its mesh. Error maps are merged
+    across tile edges first, so neighbouring tiles meet without cracks at every LOD.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    heights = load_height_tiles(tiles_dir, min_height, max_height)
+    grid_size = next(iter(heights.values())).shape[0]
+    rtin = Rtin(grid_size)
+
+    error_maps = {key: rtin.errors(tile) for key, tile in heights.items()}
+    # Rows go south, so the tile north of another one comes first in a "y" seam
+    seams = [((i, j), (i + 1, j), "x") for i in range(x_segments - 1) for j in range(y_segments)]
+    seams += [((i, j + 1), (i, j), "y") for i in range(x_segments) for j in range(y_segments - 1)]
+    merge_seams(rtin, error_maps, seams)
+
+    lat_step = (max_lat - min_lat) / y_segments
+    lon_step = (max_lon - min_lon) / x_segments
+    children = []
+    triangle_counts = [0] * len(lod_errors)
+
+    for (i, j), tile in heights.items():
+        quadrant, udim = get_quadrant_and_udim(i, j)
+        region = [
+            math.radians(min_lon + i * lon_step), math.radians(min_lat + j * lat_step),
+            math.radians(min_lon + (i + 1) * lon_step), math.radians(min_lat + (j + 1) * lat_step),
+            float(tile.min()), float(tile.max()),
+        ]
+
+        node = None
+        for lod in reversed(range(len(lod_errors))):
+            vertices, triangles = rtin.mesh(error_maps[i, j], lod_errors[lod])
+            error = rtin.mesh_error(tile, vertices, triangles)
+            triangle_counts[lod] += len(triangles)
+
+            # Terrain space (X east, Y north, Z up) to glTF's Y up
+            x = x_min + i * x_step + vertices[:, 0] / (grid_size - 1) * x_step
+            y = y_min + (j + 1) * y_step - vertices[:, 1] / (grid_size - 1) * y_step
+            z = tile[vertices[:, 1], vertices[:, 0]]
+            uri = f"{quadrant}_{udim}_lod{lod}.glb"
+            write_glb(os.path.join(output_dir, uri), np.stack([x, z, -y], axis=1), triangles)
+
+            lod_node = {
+                "boundingVolume": {"region": region},
+                "geometricError": error,
+                "refine": "REPLACE",
+                "content": {"uri": uri},
+            }
+            if node is not None:
+                lod_node["children"] = [node]
+            node = lod_node
+        children.append(node)
+
+    root_error = max(child["geometricError"] for child in children)
+    tileset = {
+        "asset": {"version": "1.0", "gltfUpAxis": "Y"},
+        "geometricError": root_error * 2,
+        "root": {
+            "transform": east_north_up((min_lat + max_lat) / 2, (min_lon + max_lon) / 2),
+            "boundingVolume": {"region": [
+                math.radians(min_lon), math.radians(min_lat), math.radians(max_lon), math.radians(max_lat),
+                min(child["boundingVolume"]["region"][4] for child in children),
+                max(child["boundingVolume"]["region"][5] for child in children),
+            ]},
+            "geometricError": root_error * 2,
+            "refine": "ADD",
+            "children": children,
+        },
+    }
+    with open(os.path.join(output_dir, "tileset.json"), "w") as f:
+        json.dump(tileset, f, indent=2)
+
+    for lod, count in enumerate(triangle_counts):
+        print(f"LOD {lod} (cut at {lod_errors[lod]} m): {count} triangles")
+    print(f"Saved {len(children)} terrain tiles and tileset.json to {output_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesh per-UDIM height map tiles into RTIN LODs with a 3D Tiles tileset.")
+    parser.add_argument("tiles_dir", help="Folder of {quadrant}_{udim}.png height tiles from heightmap_tiles.py")
+    parser.add_argument("output_dir")
+    parser.add_argument("--bbox", type=float, nargs=4, required=True, metavar=("MIN_LAT", "MAX_LAT", "MIN_LON", "MAX_LON"))
+    parser.add_argument("--heights", type=float, nargs=2, required=True, metavar=("MIN", "MAX"), help="Heights of 0 and 65535 in metres")
+    parser.add_argument("--errors", type=float, nargs="+", default=LOD_ERRORS, help="Error threshold of every LOD in metres, coarse to fine")
+    args = parser.parse_args()
+
+    export_lod_tileset(args.tiles_dir, args.output_dir, *args.heights, *args.bbox, lod_errors=args.errors)
@@ -1,6 +1,8 @@
 import bpy
 import re
 
+from mesh_arrays import get_uvs, set_uvs
+
 
 def restore_uvs_to_original_udim():
     # Get selected mesh objects
@@ -41,13 +43,9 @@ def restore_uvs_to_original_udim():
             print(f"No UV layer in {obj_name}, skipping")
             continue
 
-        uv_layer = obj.data.uv_layers.active.data
-
         # Restore UV coordinates
-        for loop in obj.data.loops:
-            uv = uv_layer[loop.index].uv
-            uv.x += U
-            uv.y += V
+        uvs = get_uvs(obj.data)
+        set_uvs(obj.data, uvs + (U, V))
 
         print(f"Restored UVs for {obj_name} to UDIM {udim_num}")
 
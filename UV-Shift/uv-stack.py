@@ -1,5 +1,7 @@
 import bpy
 
+from mesh_arrays import get_uvs, set_uvs
+
 
 def move_uvs_to_udim_1001():
     # Either get selected mesh objects
@@ -19,13 +21,9 @@ def move_uvs_to_udim_1001():
             print(f"No UV layer found for {obj.name}")
             continue
 
-        uv_layer = obj.data.uv_layers.active.data
-
-        # Loop through all UVs and clamp them to [0,1] by discarding integers
-        for loop in obj.data.loops:
-            uv = uv_layer[loop.index].uv
-            uv.x = uv.x % 1.0  # Keep only the fractional part (e.g., 1.7 → 0.7)
-            uv.y = uv.y % 1.0  # Same for V
+        # Clamp all UVs to [0,1] by discarding integers
+        uvs = get_uvs(obj.data)
+        set_uvs(obj.data, uvs % 1.0)  # Keep only the fractional part (e.g., 1.7 → 0.7)
 
     print("All UVs moved to UDIM 1001 (no scaling, only fractional parts retained).")
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The ESA helpers are plain modules imported by the notebooks from their own folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ESA"))
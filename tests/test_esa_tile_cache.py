@@ -0,0 +1,61 @@
+from esa_tile_cache import TileCache
+
+SOURCE = "http://127.0.0.1/api/esa"
+
+
+def indexed_bytes(cache):
+    return cache.db.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+
+
+def test_running_total(tmp_path):
+    cache = TileCache(str(tmp_path))
+    cache.put(SOURCE, 10, 0, 0, b"a" * 100)
+    cache.put(SOURCE, 10, 0, 1, b"b" * 50)
+    cache.put(SOURCE, 10, 0, 0, b"c" * 30)  # Replaced
+    cache.put(SOURCE, 10, 0, 2, None)
+    assert cache.total_bytes() == indexed_bytes(cache) == 80
+    cache.close()
+
+    # Picked up from the index on the next run
+    assert TileCache(str(tmp_path)).total_bytes() == 80
+
+
+def test_hits_are_written_on_flush(tmp_path):
+    cache = TileCache(str(tmp_path))
+    for y in range(10):
+        cache.put(SOURCE, 10, 0, y, b"a" * 10)
+    cache.close()
+
+    cache = TileCache(str(tmp_path))
+    statements = []
+    cache.db.set_trace_callback(statements.append)
+    for y in range(10):
+        assert cache.get(SOURCE, 10, 0, y)
+    assert not any(statement.startswith("UPDATE") for statement in statements)
+
+    cache.flush()
+    assert sum(statement.startswith("UPDATE") for statement in statements) == 10
+    assert statements.count("COMMIT") == 1
+    cache.close()
+
+
+def test_eviction_keeps_tiles_in_use(tmp_path):
+    cache = TileCache(str(tmp_path), max_bytes=300)
+    for y in range(3):
+        cache.put(SOURCE, 10, 0, y, b"a" * 100)
+    cache.close()
+
+    # A new run reads the oldest tile, then adds two more: the unread ones go first
+    cache = TileCache(str(tmp_path), max_bytes=300)
+    assert cache.get(SOURCE, 10, 0, 0)
+    cache.put(SOURCE, 10, 1, 0, b"b" * 100)
+    cache.put(SOURCE, 10, 1, 1, b"b" * 100)
+    assert cache.get(SOURCE, 10, 0, 0)
+    assert cache.get(SOURCE, 10, 0, 1) is None and cache.get(SOURCE, 10, 0, 2) is None
+    assert cache.total_bytes() == indexed_bytes(cache) == 300
+
+    # Nothing left to evict but this run's tiles, so the cap is exceeded rather than losing them
+    cache.put(SOURCE, 10, 1, 2, b"b" * 100)
+    assert all(cache.get(SOURCE, 10, 1, y) for y in range(3))
+    assert cache.total_bytes() == indexed_bytes(cache) == 400
+    cache.close()
@@ -0,0 +1,119 @@
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from esa_tile_cache import TileCache
+from esa_tiles import fetch_tiles_for_area, get_pixel_window, tiles_in_window
+
+ZOOM = 10
+BBOX = (45.0, 45.5, 7.0, 7.8)  # min_lat, max_lat, min_lon, max_lon
+
+# Most 503s a tile gets before it is served, kept under the fetcher's retries
+MAX_UNAVAILABLE = 2
+
+
+def png_tile():
+    buffer = BytesIO()
+    Image.new("RGB", (256, 256), (0, 100, 0)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class EsaStandIn:
+    """
+    Local stand-in for /api/esa/{z}/{x}/{y}.png.
+
+    A random quarter of the tiles are 404, every other tile answers 503 a random
+    number of times (0 to MAX_UNAVAILABLE, at least one tile the most) before its
+    PNG is served.
+    """
+
+    def __init__(self, seed=0):
+        rng = random.Random(seed)
+        self.tiles = [(x, y) for x, y, _, _ in tiles_in_window(get_pixel_window(*BBOX, ZOOM))]
+        self.absent = set(rng.sample(self.tiles, len(self.tiles) // 4))
+        self.unavailable = {tile: rng.randint(0, MAX_UNAVAILABLE) for tile in self.tiles}
+        self.unavailable[next(tile for tile in self.tiles if tile not in self.absent)] = MAX_UNAVAILABLE
+        self.png = png_tile()
+        self.requests = []
+        self.lock = threading.Lock()
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = stand_in.respond(self.path)
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/api/esa"
+
+    def respond(self, path):
+        zoom, x, y = path[len("/api/esa/"):-len(".png")].split("/")
+        tile = (int(x), int(y))
+        with self.lock:
+            self.requests.append(tile)
+            if int(zoom) != ZOOM or tile not in self.unavailable or tile in self.absent:
+                return 404, b""
+            if self.unavailable[tile]:
+                self.unavailable[tile] -= 1
+                return 503, b""
+        return 200, self.png
+
+
+@pytest.fixture
+def stand_in():
+    stand_in = EsaStandIn()
+    thread = threading.Thread(target=stand_in.server.serve_forever, daemon=True)
+    thread.start()
+    yield stand_in
+    stand_in.server.shutdown()
+    stand_in.server.server_close()
+
+
+def test_fetch_tiles_for_area(stand_in, tmp_path):
+    cache = TileCache(str(tmp_path / "cache"))
+    calls = []
+
+    def fetch():
+        return fetch_tiles_for_area(*BBOX, ZOOM, stand_in.base_url, cache, workers=4, backoff=0.01,
+                                    progress=lambda done, total: calls.append((done, total)))
+
+    retried = {tile for tile, count in stand_in.unavailable.items() if count and tile not in stand_in.absent}
+    failed, missing = fetch()
+    served = set(stand_in.tiles) - stand_in.absent
+
+    # 503s are retried until the tile is served
+    assert retried and failed == []
+    assert all(stand_in.requests.count(tile) > 1 for tile in retried)
+    assert not any(stand_in.unavailable[tile] for tile in served)
+
+    # 404s are reported as missing, not raised or retried
+    assert stand_in.absent and set(missing) == stand_in.absent
+    assert all(stand_in.requests.count(tile) == 1 for tile in stand_in.absent)
+
+    # The cache holds exactly the tiles served with a 200
+    paths = {tile: cache.get(stand_in.base_url, ZOOM, *tile) for tile in stand_in.tiles}
+    assert {tile for tile, path in paths.items() if path} == served
+    assert all(paths[tile] == "" for tile in stand_in.absent)
+    for tile in served:
+        with open(paths[tile], "rb") as f:
+            assert f.read() == stand_in.png
+
+    assert calls[-1] == (len(stand_in.tiles), len(stand_in.tiles))
+    assert [done for done, _ in calls] == list(range(1, len(stand_in.tiles) + 1))
+
+    # A second run is served from the cache
+    requests_made = len(stand_in.requests)
+    assert fetch() == ([], [])
+    assert len(stand_in.requests) == requests_made
+    cache.close()